@@ -110,8 +110,8 @@ If you encounter an error, try alternative approaches or ask the user for clarif
                 })
                 
                 # If this is a screenshot, let the user know
-                if tool_name == "playwright_screenshot":
-                    print(f"Screenshot saved as {arguments.get('name', 'screenshot')}.png")
+                if tool_name == "playwright_screenshot" and arguments.get("path"):
+                    print(f"Screenshot saved as {arguments['path']}")
                 
                 # If this is a manual action prompt, wait for user input
                 if "MANUAL ACTION REQUIRED" in str(result):
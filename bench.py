@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+from server import ERROR_PREFIXES
+
+# Offline benchmark for every tool in server.py. Fixture pages are served from
+# this process, server.py is driven over its real MCP transport, and the results
+# are printed as JSON so runs can be diffed across changes:
+#
+#   python bench.py --iterations 30 --output bench_output.txt
+
+def _page(title: str, body: str, head: str = "") -> bytes:
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>{title}</title>
+    {head}
+</head>
+<body>
+{body}
+</body>
+</html>""".encode("utf-8")
+
+# Shared by the small and large pages so workloads can click and fill on either
+CONTROLS = """
+    <p id="status">Ready</p>
+    <button id="go" onclick="document.getElementById('status').textContent = 'Clicked ' + Date.now()">Go</button>
+    <button onclick="const c = document.getElementById('count'); c.textContent = +c.textContent + 1">Increment</button>
+    <span id="count">0</span>
+    <label>Name <input id="name" type="text"></label>"""
+
+def _small_page(query: dict) -> bytes:
+    return _page("Small page", "<h1>Small page</h1>" + CONTROLS + """
+    <ul>""" + "".join(f"<li class=\"item\">Item {i}</li>" for i in range(40)) + "</ul>")
+
+def _large_page(query: dict) -> bytes:
+    rows = int(query.get("rows", ["5000"])[0])
+    body = ["<h1>Large page</h1>", CONTROLS, "<table id=\"grid\"><tbody>"]
+    for i in range(rows):
+        body.append(
+            f"<tr><td>{i}</td><td><a href=\"#row{i}\">Row {i}</a></td>"
+            f"<td><span class=\"cell\">Lorem ipsum dolor sit amet {i}</span></td>"
+            f"<td><input name=\"row{i}\" value=\"{i}\"></td></tr>"
+        )
+    body.append("</tbody></table>")
+    return _page("Large page", "".join(body))
+
+def _nested_page(query: dict) -> bytes:
+    depth = int(query.get("depth", ["3"])[0])
+    if depth <= 0:
+        return _page("Innermost frame", '<p>Innermost</p><input id="deep" type="text"><button id="deep-go">Deep</button>')
+    return _page(f"Frame level {depth}", f'<p>Level {depth}</p><iframe name="level{depth}" src="/nested?depth={depth - 1}" width="600" height="300"></iframe>')
+
+def _popup_page(query: dict) -> bytes:
+    return _page("Popup opener", '<h1>Popups</h1><a id="open" href="/small" target="_blank">Open a new tab</a>')
+
+def _downloads_page(query: dict) -> bytes:
+    return _page("Downloads", '<h1>Downloads</h1><a id="file" href="/file?kb=256" download="report.bin">Download report</a>')
+
+def _office_page(query: dict) -> bytes:
+    # Shaped like PowerPoint Online: the editor lives in a named iframe next to a ribbon
+    return _page("Presentation - PowerPoint", """
+    <div role="tablist" id="ribbon">""" + "".join(
+        f'<button role="tab">{tab}</button>' for tab in ("File", "Home", "Insert", "Design", "Transitions", "Animations", "Review", "View")
+    ) + """</div>
+    <iframe name="WacFrame_PowerPoint_0" src="/office-canvas" width="1000" height="700"></iframe>""")
+
+def _office_canvas_page(query: dict) -> bytes:
+    slides = int(query.get("slides", ["60"])[0])
+    thumbnails = "".join(
+        f'<div class="thumb" role="option" aria-label="Slide {i + 1}"><div class="shape">Slide {i + 1} title</div>'
+        + "".join(f'<div class="shape">Bullet {j}</div>' for j in range(8)) + "</div>"
+        for i in range(slides)
+    )
+    return _page("PowerPoint canvas", f"""
+    <div id="thumbnails" role="listbox">{thumbnails}</div>
+    <div id="slide" role="main">
+        <div id="title" contenteditable="true" class="placeholder">Click to add title</div>
+        <div id="subtitle" contenteditable="true" class="placeholder">Click to add subtitle</div>
+    </div>""", head="<style>.thumb { height: 60px; overflow: hidden; } #slide { width: 800px; height: 450px; }</style>")
+
+FIXTURES = {
+    "/small": _small_page,
+    "/large": _large_page,
+    "/nested": _nested_page,
+    "/popup": _popup_page,
+    "/downloads": _downloads_page,
+    "/office": _office_page,
+    "/office-canvas": _office_canvas_page,
+}
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/file":
+            body = os.urandom(int(query.get("kb", ["64"])[0]) * 1024)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Disposition", 'attachment; filename="report.bin"')
+        elif url.path in FIXTURES:
+            body = FIXTURES[url.path](query)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+        else:
+            body = b"Not found"
+            self.send_response(404)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FixtureServer:
+    """Serves the fixture pages on a free localhost port from a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), _FixtureHandler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def percentile(samples: list[float], q: float) -> float:
+    """Nearest-rank percentile of the samples, 0 for no samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+def latency_summary(samples_ms: list[float]) -> dict:
+    return {
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 2) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 0.50), 2),
+        "p95_ms": round(percentile(samples_ms, 0.95), 2),
+        "p99_ms": round(percentile(samples_ms, 0.99), 2),
+        "max_ms": round(max(samples_ms), 2) if samples_ms else 0.0,
+    }
+
+def is_error(result) -> bool:
+    if result.isError:
+        return True
+    text = next((item.text for item in result.content if item.type == "text"), "")
+    # Same prefixes server.py uses to tell failed steps apart in batches and recordings
+    return text.startswith(ERROR_PREFIXES)
+
+def server_environment(workdir: str) -> dict:
+    """Environment for a spawned server.py: headless, with every on-disk store under workdir."""
+    env = dict(os.environ)
+    env.setdefault("PLAYWRIGHT_HEADLESS", "true")
+    for variable, name in (
+        ("PLAYWRIGHT_DOWNLOADS_DIR", "downloads"), ("PLAYWRIGHT_PROFILES_DIR", "profiles"),
+        ("PLAYWRIGHT_RECORDINGS_DIR", "recordings"), ("PLAYWRIGHT_TRACES_DIR", "traces"),
+    ):
+        env[variable] = os.path.join(workdir, name)
+    return env
+
+def connect(transport: str, url: str | None, workdir: str, server_args: list[str] | None = None):
+    """Client streams for server.py: a spawned stdio server, or a running sse / streamable-http server at url."""
+    if transport == "stdio":
+        params = StdioServerParameters(
+            command=sys.executable,
+            args=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")] + (server_args or []),
+            env=server_environment(workdir),
+        )
+        return stdio_client(params)
+    if transport == "sse":
+        return sse_client(url or "http://127.0.0.1:8931/sse")
+    return streamablehttp_client(url or "http://127.0.0.1:8931/mcp")
+
+def build_cases(fixtures: FixtureServer, workdir: str) -> list[dict]:
+    """
+    Every case navigates to its fixture, runs its setup calls once, then times the tool.
+    before_each / after_each calls run around every timed call without being timed.
+    """
+    small, large = fixtures.url("/small"), fixtures.url("/large")
+    office, nested = fixtures.url("/office"), fixtures.url("/nested?depth=3")
+    popup, downloads = fixtures.url("/popup"), fixtures.url("/downloads")
+    replay_path = os.path.join(workdir, "bench_flow.json")
+    return [
+        {"name": "navigate_small", "page": small, "tool": "playwright_navigate", "arguments": {"url": small}},
+        {"name": "navigate_large", "page": small, "tool": "playwright_navigate", "arguments": {"url": large, "summary": "none"}},
+        {"name": "navigate_text_summary", "page": small, "tool": "playwright_navigate", "arguments": {"url": small, "summary": "text"}},
+        {"name": "get_text_content_small", "page": small, "tool": "playwright_get_text_content", "arguments": {}},
+        {"name": "get_text_content_large", "page": large, "tool": "playwright_get_text_content", "arguments": {}},
+        {"name": "snapshot_large", "page": large, "tool": "playwright_snapshot", "arguments": {}},
+        {"name": "snapshot_office_interactive", "page": office, "tool": "playwright_snapshot", "arguments": {"interactive_only": True}},
+        {"name": "get_html_content_large", "page": large, "tool": "playwright_get_html_content", "arguments": {"selector": "body"}},
+        {"name": "evaluate", "page": small, "tool": "playwright_evaluate", "arguments": {"script": "document.title"}},
+        {"name": "call_script", "page": small, "tool": "playwright_call_script", "arguments": {"name": "count", "args": [".item"]}},
+        {"name": "register_script", "page": small, "tool": "playwright_register_script",
+         "arguments": {"name": "bench_items", "source": "() => document.querySelectorAll('.item').length"}},
+        {"name": "click", "page": small, "tool": "playwright_click", "arguments": {"selector": "#go"}},
+        {"name": "click_expect_none", "page": small, "tool": "playwright_click", "arguments": {"selector": "#go", "expect": "none"}},
+        {"name": "click_text", "page": small, "tool": "playwright_click_text", "arguments": {"text": "Increment"}},
+        {"name": "fill", "page": small, "tool": "playwright_fill", "arguments": {"selector": "#name", "value": "benchmark"}},
+        {"name": "fill_office_canvas", "page": office, "tool": "playwright_fill",
+         "arguments": {"selector": "#title", "value": "PPT Agent", "frame": "WacFrame_PowerPoint_0"}},
+        {"name": "get_text_content_office_frame", "page": office, "tool": "playwright_get_text_content",
+         "arguments": {"frame": "WacFrame_PowerPoint_0"}},
+        {"name": "screenshot_png", "page": small, "tool": "playwright_screenshot", "arguments": {}},
+        {"name": "screenshot_large_jpeg", "page": large, "tool": "playwright_screenshot",
+         "arguments": {"format": "jpeg", "quality": 60, "full_page": False}},
+        {"name": "screenshot_webp_downscaled", "page": office, "tool": "playwright_screenshot",
+         "arguments": {"format": "webp", "quality": 60, "max_width": 640}},
+        {"name": "wait_for_selector", "page": small, "tool": "playwright_wait_for",
+         "arguments": {"condition": "selector_visible", "selector": "#go"}},
+        {"name": "wait_for_text", "page": small, "tool": "playwright_wait_for", "arguments": {"condition": "text", "text": "Item 39"}},
+        {"name": "wait_for_timeout_0", "page": small, "tool": "playwright_wait_for_timeout", "arguments": {"timeout": 0}},
+        {"name": "list_frames_nested", "page": nested, "tool": "playwright_list_frames", "arguments": {}},
+        {"name": "frame_nested", "page": nested, "tool": "playwright_frame", "arguments": {"name": "level1"},
+         "after_each": [("playwright_frame", {})]},
+        {"name": "fill_nested_frame", "page": nested, "tool": "playwright_fill",
+         "arguments": {"selector": "#deep", "value": "deep", "frame": "level1"}},
+        {"name": "download_file", "page": downloads, "tool": "playwright_download_file", "arguments": {"selector": "#file"}},
+        {"name": "fetch_url", "page": downloads, "tool": "playwright_fetch_url", "arguments": {"url": fixtures.url("/file?kb=256")}},
+        {"name": "wait_for_download", "page": downloads, "tool": "playwright_wait_for_download", "arguments": {},
+         "before_each": [("playwright_download_file", {"selector": "#file", "wait": False})]},
+        {"name": "list_downloads", "page": downloads, "tool": "playwright_list_downloads", "arguments": {}},
+        {"name": "batch", "page": small, "tool": "playwright_batch", "arguments": {"steps": [
+            {"tool": "playwright_fill", "arguments": {"selector": "#name", "value": "batch"}},
+            {"tool": "playwright_click", "arguments": {"selector": "#go", "expect": "none"}},
+            {"tool": "playwright_evaluate", "arguments": {"script": "document.getElementById('status').textContent"}, "name": "status"},
+        ]}},
+        {"name": "replay", "page": small, "tool": "playwright_replay", "arguments": {"path": replay_path},
+         "setup": [
+             ("playwright_record_start", {}),
+             ("playwright_fill", {"selector": "#name", "value": "recorded"}),
+             ("playwright_click", {"selector": "#go", "expect": "none"}),
+             ("playwright_record_stop", {"path": replay_path}),
+         ]},
+        {"name": "save_storage_state", "page": small, "tool": "playwright_save_storage_state", "arguments": {"profile": "bench"}},
+        {"name": "load_storage_state", "page": small, "tool": "playwright_load_storage_state", "arguments": {"profile": "bench"}},
+        # Leaves tracing on, the trace_start_stop case right after stops it
+        {"name": "trace_save", "page": small, "tool": "playwright_trace_save", "arguments": {},
+         "setup": [("playwright_trace_start", {})],
+         "before_each": [("playwright_click", {"selector": "#go", "expect": "none"})]},
+        {"name": "trace_start_stop", "page": small, "tool": "playwright_trace_stop", "arguments": {},
+         "before_each": [("playwright_trace_start", {}), ("playwright_click", {"selector": "#go", "expect": "none"})]},
+        {"name": "new_session", "page": small, "tool": "playwright_new_session", "arguments": {},
+         "after_each": [("playwright_close_session", {})]},
+        {"name": "close_session", "page": small, "tool": "playwright_close_session", "arguments": {},
+         "before_each": [("playwright_new_session", {})]},
+        # Popup cases run last, the tabs they open stay open in the session
+        {"name": "click_popup", "page": popup, "tool": "playwright_click", "arguments": {"selector": "#open", "expect": "popup"},
+         "after_each": [("playwright_switch_to_page", {"index": 0})]},
+        {"name": "list_pages", "page": popup, "tool": "playwright_list_pages", "arguments": {}},
+        {"name": "switch_to_page", "page": popup, "tool": "playwright_switch_to_page", "arguments": {"index": 0}},
+        {"name": "fan_out_evaluate", "page": popup, "tool": "playwright_fan_out", "arguments": {"operation": "evaluate", "script": "document.title"}},
+        {"name": "fan_out_text", "page": popup, "tool": "playwright_fan_out", "arguments": {"operation": "text"}},
+        {"name": "fan_out_screenshot", "page": popup, "tool": "playwright_fan_out", "arguments": {"operation": "screenshot"}},
+    ]
+
+async def run_case(session: ClientSession, case: dict, iterations: int, warmup: int) -> dict:
+    await session.call_tool("playwright_navigate", {"url": case["page"], "summary": "none"})
+    setup_errors = 0
+    for tool, arguments in case.get("setup", []):
+        setup_errors += is_error(await session.call_tool(tool, arguments))
+    samples = []
+    errors = 0
+    first_error = None
+    for iteration in range(warmup + iterations):
+        for tool, arguments in case.get("before_each", []):
+            await session.call_tool(tool, arguments)
+        started = time.perf_counter()
+        try:
+            result = await session.call_tool(case["tool"], case["arguments"])
+            failed = is_error(result)
+            if failed and first_error is None:
+                first_error = next((item.text for item in result.content if item.type == "text"), "")[:200]
+        except Exception as e:
+            failed = True
+            first_error = first_error or str(e)[:200]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for tool, arguments in case.get("after_each", []):
+            await session.call_tool(tool, arguments)
+        if iteration < warmup:
+            continue
+        samples.append(elapsed_ms)
+        errors += failed
+    total_s = sum(samples) / 1000
+    report = {
+        "tool": case["tool"],
+        "calls": len(samples),
+        "errors": errors,
+        "ops_per_sec": round(len(samples) / total_s, 2) if total_s else 0.0,
+        **latency_summary(samples),
+    }
+    if setup_errors:
+        report["setup_errors"] = setup_errors
+    if first_error:
+        report["first_error"] = first_error
+    return report
+
+async def run_benchmark(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="mcp-bench-")
+    with FixtureServer() as fixtures:
+        cases = build_cases(fixtures, workdir)
+        if args.cases:
+            selected = set(args.cases.split(","))
+            cases = [case for case in cases if case["name"] in selected]
+        started = time.time()
+        async with connect(args.transport, args.url, workdir) as streams:
+            async with ClientSession(streams[0], streams[1]) as session:
+                await session.initialize()
+                await session.call_tool("playwright_new_session", {})
+                results = {}
+                for case in cases:
+                    try:
+                        results[case["name"]] = await run_case(session, case, args.iterations, args.warmup)
+                    except Exception as e:
+                        results[case["name"]] = {"tool": case["tool"], "error": str(e)[:200]}
+                    if not args.quiet:
+                        print(f"{case['name']}: {json.dumps(results[case['name']])}", file=sys.stderr)
+                server_metrics = None
+                try:
+                    contents = (await session.read_resource("metrics://tools")).contents
+                    server_metrics = json.loads(contents[0].text)
+                except Exception:
+                    pass
+    return {
+        "meta": {
+            "transport": args.transport,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "started": started,
+            "duration_s": round(time.time() - started, 2),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+        "server_metrics": server_metrics,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every server.py tool against local fixture pages")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default="stdio",
+                        help="stdio spawns server.py, the network transports connect to --url")
+    parser.add_argument("--url", help="Server URL for sse / streamable-http, e.g. http://127.0.0.1:8931/mcp")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed calls per case")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed calls per case before timing")
+    parser.add_argument("--cases", help="Comma separated case names to run, defaults to all")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--quiet", action="store_true", help="Do not print per-case progress to stderr")
+    return parser.parse_args(argv)
+
+async def main(argv=None):
+    args = parse_args(argv)
+    report = await run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+
+if __name__ == "__main__":
+    asyncio.run(main())
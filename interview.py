@@ -239,12 +239,14 @@ async def run_interview():
                     result = await session.call_tool("playwright_click", arguments={
                         "selector": "span:nth-of-type(4) > a"
                     })
-                    print("Clicked download link. Check downloads folder for the file.")
+                    print("Clicked download link. Waiting for the download to finish...")
                     
                     # Wait for download to complete
-                    await session.call_tool("playwright_wait_for_timeout", arguments={
+                    result = await session.call_tool("playwright_wait_for_download", arguments={
+                        "save_path": resume_path,
                         "timeout": 10000
                     })
+                    print(result)
                 except Exception as e2:
                     print(f"Error with fallback method: {e2}")
             
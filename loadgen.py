@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from mcp import ClientSession
+
+from bench import FixtureServer, connect, is_error, latency_summary, server_environment
+
+# Concurrent load against server.py. N clients each open their own MCP session
+# and browser session, then replay a weighted mix of operations against the
+# bench.py fixture pages for a fixed duration or call count:
+#
+#   python loadgen.py --clients 8 --duration 60 --mix navigate=1,click=3,text=2,screenshot=1
+#   python loadgen.py --transport streamable-http --clients 32 --calls 200
+#
+# stdio spawns one server.py per client. The network transports share one server,
+# spawned here unless --url points at a running one.
+
+def operations(fixtures: FixtureServer) -> dict:
+    """Workload operations, each a function of a random generator returning (tool, arguments)."""
+    small, large = fixtures.url("/small"), fixtures.url("/large?rows=2000")
+    return {
+        "navigate": lambda rng: ("playwright_navigate", {"url": small}),
+        "navigate_large": lambda rng: ("playwright_navigate", {"url": large, "summary": "none"}),
+        "click": lambda rng: ("playwright_click", {"selector": "#go", "expect": "none"}),
+        "fill": lambda rng: ("playwright_fill", {"selector": "#name", "value": f"load {rng.randrange(1000)}"}),
+        "text": lambda rng: ("playwright_get_text_content", {"max_chars": 4000}),
+        "snapshot": lambda rng: ("playwright_snapshot", {"interactive_only": True}),
+        "evaluate": lambda rng: ("playwright_evaluate", {"script": "document.title"}),
+        "screenshot": lambda rng: ("playwright_screenshot", {"format": "jpeg", "quality": 60, "full_page": False}),
+    }
+
+def parse_mix(mix: str, available: dict) -> list[tuple[str, float]]:
+    weights = []
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in available:
+            raise SystemExit(f"Unknown operation {name!r}, choose from {', '.join(available)}")
+        weights.append((name, float(weight or 1)))
+    return weights
+
+def _process_table() -> dict[int, tuple[str, int]]:
+    """pid -> (name, parent pid) for every process, read from /proc."""
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+        # The name is in parentheses and may itself contain spaces
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        table[int(entry)] = (name, ppid)
+    return table
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+def process_tree_rss(root_pids: list[int]) -> dict:
+    """
+    Summed RSS of every process below root_pids, split into browser processes and
+    the rest (server.py, the Playwright driver). Shared pages are counted once per
+    process, so the sum overstates real memory use but tracks its growth.
+    """
+    if not os.path.isdir("/proc"):
+        return {}
+    table = _process_table()
+    children: dict[int, list[int]] = {}
+    for pid, (_, ppid) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    pending = [pid for root in root_pids for pid in children.get(root, [])]
+    browser, other, processes = 0, 0, 0
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        rss = _rss_bytes(pid)
+        processes += 1
+        name = table[pid][0].lower()
+        if "chrom" in name or "headless_shell" in name or "firefox" in name or "webkit" in name:
+            browser += rss
+        else:
+            other += rss
+    return {
+        "processes": processes,
+        "browser_rss_mb": round(browser / 2**20, 1),
+        "other_rss_mb": round(other / 2**20, 1),
+    }
+
+class LoadStats:
+    def __init__(self):
+        self.samples: list[tuple[float, str, float, bool]] = []
+        self.clients_connected = 0
+        self.clients_failed: list[str] = []
+        self.first_errors: dict[str, str] = {}
+
+    def record(self, operation: str, elapsed_ms: float, failed: bool, error: str | None = None):
+        self.samples.append((time.monotonic(), operation, elapsed_ms, failed))
+        if failed and error and operation not in self.first_errors:
+            self.first_errors[operation] = error[:200]
+
+async def run_client(index: int, args, ops: dict, weights: list, stats: LoadStats, workdir: str, deadline: float | None):
+    rng = random.Random(args.seed + index)
+    names = [name for name, _ in weights]
+    weight_values = [weight for _, weight in weights]
+    await asyncio.sleep(args.ramp * index / max(args.clients, 1))
+    try:
+        async with connect(args.transport, args.url, workdir) as streams:
+            async with ClientSession(streams[0], streams[1]) as session:
+                await session.initialize()
+                created = await session.call_tool("playwright_new_session", {"url": ops["navigate"](rng)[1]["url"]})
+                text = created.content[0].text if created.content else ""
+                if not text.startswith("Created session "):
+                    raise RuntimeError(text or "could not create a session")
+                session_id = text.removeprefix("Created session ")
+                stats.clients_connected += 1
+                calls = 0
+                while (deadline is None or time.monotonic() < deadline) and (not args.calls or calls < args.calls):
+                    operation = rng.choices(names, weights=weight_values)[0]
+                    tool, arguments = ops[operation](rng)
+                    started = time.perf_counter()
+                    error = None
+                    try:
+                        result = await session.call_tool(tool, {**arguments, "session_id": session_id})
+                        failed = is_error(result)
+                        if failed:
+                            error = next((item.text for item in result.content if item.type == "text"), "")
+                    except Exception as e:
+                        failed, error = True, str(e)
+                    stats.record(operation, (time.perf_counter() - started) * 1000, failed, error)
+                    calls += 1
+                await session.call_tool("playwright_close_session", {"session_id": session_id})
+    except Exception as e:
+        # The transports wrap failures in exception groups, report the underlying error
+        while isinstance(e, BaseExceptionGroup) and e.exceptions:
+            e = e.exceptions[0]
+        stats.clients_failed.append(f"client {index}: {e}")
+
+async def sample_timeline(stats: LoadStats, interval: float, root_pids: list[int], timeline: list, started: float, quiet: bool):
+    seen = 0
+    while True:
+        await asyncio.sleep(interval)
+        window = stats.samples[seen:]
+        seen += len(window)
+        latency = latency_summary([sample[2] for sample in window])
+        point = {
+            "t": round(time.monotonic() - started, 1),
+            "calls": len(window),
+            "errors": sum(1 for sample in window if sample[3]),
+            "ops_per_sec": round(len(window) / interval, 2),
+            "p50_ms": latency["p50_ms"],
+            "p95_ms": latency["p95_ms"],
+            "clients": stats.clients_connected,
+            **process_tree_rss(root_pids),
+        }
+        timeline.append(point)
+        if not quiet:
+            print(json.dumps(point), file=sys.stderr)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def spawn_network_server(args, workdir: str) -> subprocess.Popen:
+    """Start server.py on a network transport and point args.url at it once it accepts connections."""
+    port = _free_port()
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    process = subprocess.Popen(
+        [sys.executable, server_path, "--transport", args.transport, "--port", str(port),
+         "--max-connections", str(args.clients * 4 + 16)],
+        env=server_environment(workdir),
+    )
+    args.url = f"http://127.0.0.1:{port}/" + ("sse" if args.transport == "sse" else "mcp")
+    for _ in range(200):
+        if process.poll() is not None:
+            raise SystemExit(f"server.py exited with {process.returncode} before accepting connections")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return process
+        except OSError:
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise SystemExit("server.py did not start accepting connections")
+
+async def run_load(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="mcp-load-")
+    stats = LoadStats()
+    timeline: list[dict] = []
+    server_process = None
+    with FixtureServer() as fixtures:
+        ops = operations(fixtures)
+        weights = parse_mix(args.mix, ops)
+        if args.transport != "stdio" and not args.url:
+            server_process = await spawn_network_server(args, workdir)
+        root_pids = [os.getpid()] + ([args.server_pid] if args.server_pid else [])
+        started = time.monotonic()
+        deadline = started + args.duration if args.duration and not args.calls else None
+        sampler = asyncio.create_task(sample_timeline(stats, args.interval, root_pids, timeline, started, args.quiet))
+        try:
+            await asyncio.gather(*(
+                run_client(index, args, ops, weights, stats, workdir, deadline) for index in range(args.clients)
+            ))
+        finally:
+            sampler.cancel()
+            elapsed = time.monotonic() - started
+            final_rss = process_tree_rss(root_pids)
+            if server_process is not None:
+                server_process.terminate()
+                try:
+                    server_process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    server_process.kill()
+
+    by_operation: dict[str, list[tuple[float, bool]]] = {}
+    for _, operation, elapsed_ms, failed in stats.samples:
+        by_operation.setdefault(operation, []).append((elapsed_ms, failed))
+    total_errors = sum(1 for sample in stats.samples if sample[3])
+    return {
+        "meta": {
+            "transport": args.transport,
+            "clients": args.clients,
+            "mix": dict(weights),
+            "duration_s": round(elapsed, 2),
+            "calls_per_client": args.calls or None,
+            "seed": args.seed,
+        },
+        "clients": {"connected": stats.clients_connected, "failed": stats.clients_failed},
+        "totals": {
+            "calls": len(stats.samples),
+            "errors": total_errors,
+            "error_rate": round(total_errors / len(stats.samples), 4) if stats.samples else 0.0,
+            "ops_per_sec": round(len(stats.samples) / elapsed, 2) if elapsed else 0.0,
+            **latency_summary([sample[2] for sample in stats.samples]),
+        },
+        "operations": {
+            operation: {
+                "calls": len(samples),
+                "errors": sum(1 for _, failed in samples if failed),
+                "error_rate": round(sum(1 for _, failed in samples if failed) / len(samples), 4),
+                "ops_per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                **latency_summary([elapsed_ms for elapsed_ms, _ in samples]),
+                **({"first_error": stats.first_errors[operation]} if operation in stats.first_errors else {}),
+            }
+            for operation, samples in by_operation.items()
+        },
+        "timeline": timeline,
+        "final_rss": final_rss,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent MCP load generator for server.py")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default="stdio",
+                        help="stdio spawns a server.py per client, the network transports share one server")
+    parser.add_argument("--url", help="Running sse / streamable-http server, spawned on a free port when omitted")
+    parser.add_argument("--server-pid", type=int, help="Pid of a server started elsewhere, to include its browsers in RSS")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent MCP client sessions")
+    parser.add_argument("--mix", default="navigate=1,click=3,text=2,screenshot=1",
+                        help="Weighted operations: navigate, navigate_large, click, fill, text, snapshot, evaluate, screenshot")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run, ignored when --calls is set")
+    parser.add_argument("--calls", type=int, default=0, help="Calls per client instead of a fixed duration")
+    parser.add_argument("--ramp", type=float, default=0, help="Seconds over which client starts are spread")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between timeline samples")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for each client's operation choices")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--quiet", action="store_true", help="Do not print timeline samples to stderr")
+    return parser.parse_args(argv)
+
+async def main(argv=None):
+    args = parse_args(argv)
+    report = await run_load(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,17 +11,74 @@ server = Server("playwright-server")
 @server.list_resources()
 async def handle_list_resources() -> list[types.Resource]:
     """
-    List available note resources.
-    Each note is exposed as a resource with a custom note:// URI scheme.
+    List available resources.
+    Large HTML results are exposed with an html:// URI scheme, server metrics with metrics://.
     """
-    return []
+    resources = [
+        types.Resource(
+            uri=AnyUrl("metrics://lanes"),
+            name="Per-page operation lanes: queue depth and wait times",
+            mimeType="application/json",
+        ),
+        types.Resource(
+            uri=AnyUrl("metrics://sessions"),
+            name="Open sessions, limits, evictions and idle reaping",
+            mimeType="application/json",
+        ),
+        types.Resource(
+            uri=AnyUrl("metrics://tools"),
+            name="Per-tool calls, errors, payload bytes and latency percentiles by phase",
+            mimeType="application/json",
+        ),
+        types.Resource(
+            uri=AnyUrl("metrics://prometheus"),
+            name="All server metrics in Prometheus text format",
+            mimeType="text/plain",
+        ),
+    ]
+    return resources + [
+        types.Resource(
+            uri=AnyUrl(f"html://{document_id}"),
+            name=f"HTML of {document['selector']} on {document['url']}",
+            mimeType="text/html",
+        )
+        for document_id, document in html_documents.items()
+        if document["owner"] == _owner()
+    ] + [
+        types.Resource(
+            uri=AnyUrl(f"trace://{trace['id']}"),
+            name=f"Trace of session {trace['session_id']} ({trace['reason']}, {trace['seconds']}s)",
+            mimeType="application/zip",
+        )
+        for trace in trace_store.records()
+        if trace["owner"] == _owner()
+    ]
 
 @server.read_resource()
 async def handle_read_resource(uri: AnyUrl) -> str:
     """
-    Read a specific note's content by its URI.
-    The note name is extracted from the URI host component.
+    Read a specific resource by its URI.
+    The document id is extracted from the URI host component.
     """
+    if uri.scheme == "html":
+        document = html_documents.get(uri.host)
+        if document is None or document["owner"] != _owner():
+            raise ValueError(f"Unknown HTML document: {uri.host}")
+        return document["html"]
+    if uri.scheme == "metrics" and uri.host == "lanes":
+        return json.dumps(page_lanes.stats())
+    if uri.scheme == "metrics" and uri.host == "sessions":
+        return json.dumps(session_lifecycle.stats())
+    if uri.scheme == "metrics" and uri.host == "tools":
+        return json.dumps(tool_metrics.snapshot())
+    if uri.scheme == "metrics" and uri.host == "prometheus":
+        return tool_metrics.prometheus()
+    if uri.scheme == "trace":
+        trace = trace_store.get(uri.host)
+        if trace is None or trace["owner"] != _owner():
+            raise ValueError(f"Unknown trace: {uri.host}")
+        with open(trace["path"], "rb") as trace_file:
+            return trace_file.read()
     raise ValueError(f"Unsupported URI scheme: {uri.scheme}")
 
 
@@ -44,55 +101,92 @@ async def handle_get_prompt(
     raise ValueError(f"Unknown prompt: {name}")
 
 
+SESSION_ID_SCHEMA = {
+    "type": "string",
+    "description": "Session returned by playwright_new_session, defaults to the most recently created session",
+}
+
+FRAME_SCHEMA = {
+    "type": "string",
+    "description": "Frame path from playwright_list_frames to run in, defaults to the frame selected with playwright_frame",
+}
+FRAME_AWARE_TOOLS = {
+    "playwright_screenshot", "playwright_click", "playwright_fill", "playwright_evaluate",
+    "playwright_click_text", "playwright_get_text_content", "playwright_get_html_content",
+    "playwright_snapshot", "playwright_wait_for", "playwright_download_file", "playwright_call_script",
+}
+
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
     """
     List available tools.
     Each tool specifies its arguments using JSON Schema validation.
     """
-    return [
-        # types.Tool(
-        #     name="playwright_new_session",
-        #     description="Create a new browser session",
-        #     inputSchema={
-        #         "type": "object",
-        #         "properties": {
-        #             "url": {"type": "string", "description": "Initial URL to navigate to"}
-        #         }
-        #     }
-        # ),
+    tools = [
+        types.Tool(
+            name="playwright_new_session",
+            description="Create a new browser session and return its session_id, pass it to other tools to target this session",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "url": {"type": "string", "description": "Initial URL to navigate to"},
+                    "profile": {"type": "string", "description": "Start from a storage state saved with playwright_save_storage_state, e.g. an authenticated login"}
+                }
+            }
+        ),
         types.Tool(
             name="playwright_navigate",
             description="Navigate to a URL,thip op will auto create a session",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "url": {"type": "string"}
+                    "url": {"type": "string"},
+                    "wait_until": {"type": "string", "enum": ["commit", "domcontentloaded", "load", "networkidle"], "description": "When to consider the navigation done, defaults to domcontentloaded"},
+                    "summary": {"type": "string", "enum": ["none", "title", "text"], "description": "What to return about the page, defaults to title"},
+                    "summary_chars": {"type": "integer", "description": "Number of text characters to return when summary is text, defaults to 200"}
                 },
                 "required": ["url"]
             }
         ),
         types.Tool(
             name="playwright_screenshot",
-            description="Take a screenshot of the current page or a specific element",
+            description="Take a screenshot of the current page or a specific element, returned in memory and only written to disk when path is given",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "name": {"type": "string"},
+                    "name": {"type": "string", "description": "Name of the screenshot"},
                     "selector": {"type": "string", "description": "CSS selector for element to screenshot,null is full page"},
+                    "ref": {"type": "string", "description": "Element ref from playwright_snapshot, alternative to selector"},
+                    "full_page": {"type": "boolean", "description": "Capture the full scrollable page instead of the viewport, defaults to true unless clip is given"},
+                    "format": {"type": "string", "enum": ["png", "jpeg", "webp"], "description": "Image encoding, defaults to png"},
+                    "quality": {"type": "integer", "minimum": 0, "maximum": 100, "description": "Quality for jpeg/webp"},
+                    "scale": {"type": "string", "enum": ["css", "device"], "description": "Capture at CSS pixels or device pixels, defaults to device"},
+                    "max_width": {"type": "integer", "description": "Downscale the image to at most this many pixels wide"},
+                    "clip": {
+                        "type": "object",
+                        "description": "Viewport-relative rectangle to capture",
+                        "properties": {
+                            "x": {"type": "number"},
+                            "y": {"type": "number"},
+                            "width": {"type": "number"},
+                            "height": {"type": "number"}
+                        },
+                        "required": ["x", "y", "width", "height"]
+                    },
+                    "path": {"type": "string", "description": "Also save the image to this file"}
                 },
-                "required": ["name"]
             }
         ),
         types.Tool(
             name="playwright_click",
-            description="Click an element on the page using CSS selector",
+            description="Click an element on the page using CSS selector or a snapshot ref",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "selector": {"type": "string", "description": "CSS selector for element to click"}
+                    "selector": {"type": "string", "description": "CSS selector for element to click"},
+                    "ref": {"type": "string", "description": "Element ref from playwright_snapshot, alternative to selector"},
+                    "expect": {"type": "string", "enum": ["auto", "none", "popup", "navigation"], "description": "What the click is expected to trigger. auto waits a short adaptive window for a popup or navigation and switches to a popup that opens later on the next call, none returns immediately"}
                 },
-                "required": ["selector"]
             }
         ),
         types.Tool(
@@ -102,14 +196,15 @@ async def handle_list_tools() -> list[types.Tool]:
                 "type": "object",
                 "properties": {
                     "selector": {"type": "string", "description": "CSS selector for input field"},
+                    "ref": {"type": "string", "description": "Element ref from playwright_snapshot, alternative to selector"},
                     "value": {"type": "string", "description": "Value to fill"}
                 },
-                "required": ["selector", "value"]
+                "required": ["value"]
             }
         ),
         types.Tool(
             name="playwright_evaluate",
-            description="Execute JavaScript in the browser console",
+            description="Execute JavaScript in the browser console, the result is returned as JSON",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -118,35 +213,83 @@ async def handle_list_tools() -> list[types.Tool]:
                 "required": ["script"]
             }
         ),
+        types.Tool(
+            name="playwright_register_script",
+            description="Register a named JavaScript function that is injected into every page and frame, call it later with playwright_call_script",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "Name to call the script by"},
+                    "source": {"type": "string", "description": "JavaScript function expression, e.g. (selector) => document.querySelector(selector).value"}
+                },
+                "required": ["name", "source"]
+            }
+        ),
+        types.Tool(
+            name="playwright_call_script",
+            description="Call a registered script or built-in helper (exists, count, texts, attributes, rect, scroll_into_view) by name, the result is returned as JSON",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "Name of the script"},
+                    "args": {"type": "array", "description": "Arguments passed to the script function"}
+                },
+                "required": ["name"]
+            }
+        ),
         types.Tool(
             name="playwright_click_text",
             description="Click an element on the page by its text content",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "text": {"type": "string", "description": "Text content of the element to click"}
+                    "text": {"type": "string", "description": "Text content of the element to click"},
+                    "expect": {"type": "string", "enum": ["auto", "none", "popup", "navigation"], "description": "What the click is expected to trigger. auto waits a short adaptive window for a popup or navigation and switches to a popup that opens later on the next call, none returns immediately"}
                 },
                 "required": ["text"]
             }
         ),
          types.Tool(
             name="playwright_get_text_content",
-            description="Get the text content of all elements",
+            description="Get the text content of all visible elements in document order",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "max_nodes": {"type": "integer", "description": "Maximum number of elements to visit, defaults to 20000"},
+                    "max_chars": {"type": "integer", "description": "Maximum number of characters to return, defaults to 100000"},
+                    "max_time_ms": {"type": "integer", "description": "Maximum time to spend walking the page in milliseconds, defaults to 2000"}
+                },
+            }
+        ),
+        types.Tool(
+            name="playwright_snapshot",
+            description="Get a compact accessibility tree of the page (role, name, state). Interactive elements get a ref usable by click, fill and screenshot",
             inputSchema={
                 "type": "object",
                 "properties": {
+                    "interactive_only": {"type": "boolean", "description": "Only list interactive elements"},
+                    "max_depth": {"type": "integer", "description": "Maximum tree depth, defaults to 50"},
+                    "max_nodes": {"type": "integer", "description": "Maximum number of nodes to list, defaults to 5000"}
                 },
             }
         ),
         types.Tool(
             name="playwright_get_html_content",
-            description="Get the HTML content of the page",
+            description="Get the sanitized HTML content of an element. Large results are returned in pages with a next_cursor and exposed as an html:// resource",
              inputSchema={
                 "type": "object",
                 "properties": {
-                    "selector": {"type": "string", "description": "CSS selector for the element"}
+                    "selector": {"type": "string", "description": "CSS selector for the element, defaults to body"},
+                    "strip": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Tags to leave out, plus 'comments' for HTML comments. Defaults to script, style, svg and comments, pass [] for raw HTML"
+                    },
+                    "collapse_whitespace": {"type": "boolean", "description": "Collapse runs of whitespace in text, defaults to true"},
+                    "max_depth": {"type": "integer", "description": "Elide elements nested deeper than this"},
+                    "page_size": {"type": "integer", "description": "Maximum characters per page, defaults to 50000"},
+                    "cursor": {"type": "string", "description": "next_cursor from a previous call, returns the following page"}
                 },
-                "required": ["selector"]
             }
         ),
         types.Tool(
@@ -157,6 +300,21 @@ async def handle_list_tools() -> list[types.Tool]:
                 "properties": {}
             }
         ),
+        types.Tool(
+            name="playwright_fan_out",
+            description="Run one read-only operation on every page/tab in parallel and return the results keyed by page index",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "operation": {"type": "string", "enum": ["evaluate", "text", "screenshot"], "description": "Operation to run on each page"},
+                    "script": {"type": "string", "description": "JavaScript to evaluate for the evaluate operation"},
+                    "max_chars": {"type": "integer", "description": "Text budget per page for the text operation, defaults to 2000"},
+                    "format": {"type": "string", "enum": ["png", "jpeg"], "description": "Image encoding for the screenshot operation, defaults to jpeg"},
+                    "quality": {"type": "integer", "minimum": 0, "maximum": 100, "description": "JPEG quality for the screenshot operation, defaults to 60"}
+                },
+                "required": ["operation"]
+            }
+        ),
         types.Tool(
             name="playwright_switch_to_page",
             description="Switch to a specific page/tab by index",
@@ -175,11 +333,51 @@ async def handle_list_tools() -> list[types.Tool]:
                 "type": "object",
                 "properties": {
                     "name": {"type": "string", "description": "Name of the iframe to switch to"},
-                    "selector": {"type": "string", "description": "CSS selector for the iframe (alternative to name)"}
+                    "selector": {"type": "string", "description": "CSS selector for the iframe in the current frame (alternative to name)"},
+                    "path": {"type": "string", "description": "Frame path as listed by playwright_list_frames (alternative to name)"}
                 },
                 "required": []
             }
         ),
+        types.Tool(
+            name="playwright_list_frames",
+            description="List the frame tree of the current page with the path of each frame",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
+        types.Tool(
+            name="playwright_save_storage_state",
+            description="Save the session's cookies, localStorage and IndexedDB under a named profile so later sessions can skip logging in",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "profile": {"type": "string", "description": "Profile name"}
+                },
+                "required": ["profile"]
+            }
+        ),
+        types.Tool(
+            name="playwright_load_storage_state",
+            description="Switch the session to a fresh context started from a saved profile",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "profile": {"type": "string", "description": "Profile name"},
+                    "reload": {"type": "boolean", "description": "Reopen the current URL in the new context, defaults to true"}
+                },
+                "required": ["profile"]
+            }
+        ),
+        types.Tool(
+            name="playwright_close_session",
+            description="Close a browser session and release its browser context",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
         types.Tool(
             name="playwright_wait_for_timeout",
             description="Wait for a specified amount of time in milliseconds",
@@ -191,241 +389,1587 @@ async def handle_list_tools() -> list[types.Tool]:
                 "required": ["timeout"]
             }
         ),
+        types.Tool(
+            name="playwright_wait_for",
+            description="Wait until a condition holds and report how long it took, prefer this over playwright_wait_for_timeout",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "condition": {
+                        "type": "string",
+                        "enum": ["selector_visible", "selector_hidden", "url", "load_state", "network_idle", "dom_quiet", "text", "download"],
+                        "description": "Condition to wait for. network_idle only sees requests that start once the wait begins, a long request already in flight is not waited for"
+                    },
+                    "selector": {"type": "string", "description": "CSS selector for selector_visible/selector_hidden"},
+                    "url": {"type": "string", "description": "URL glob (or regex if regex is true) for the url condition"},
+                    "regex": {"type": "boolean", "description": "Treat url as a regular expression"},
+                    "state": {"type": "string", "enum": ["load", "domcontentloaded", "networkidle"], "description": "Load state for the load_state condition"},
+                    "quiet_ms": {"type": "integer", "description": "Quiet period in milliseconds for network_idle/dom_quiet, defaults to 500"},
+                    "text": {"type": "string", "description": "Text to find in any frame for the text condition"},
+                    "timeout": {"type": "integer", "description": "Overall timeout in milliseconds, defaults to 30000"}
+                },
+                "required": ["condition"]
+            }
+        ),
         types.Tool(
             name="playwright_download_file",
-            description="Download a file by clicking on a link and save it to a specific path",
+            description="Download a file by clicking on a link. Returns its id, size and SHA-256, and optionally copies it to a specific path",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "selector": {"type": "string", "description": "CSS selector for the download link"},
-                    "save_path": {"type": "string", "description": "Path where to save the downloaded file"}
+                    "save_path": {"type": "string", "description": "Path where to save the downloaded file"},
+                    "wait": {"type": "boolean", "description": "Wait for the download to finish, defaults to true. Otherwise returns the download id right away"},
+                    "timeout": {"type": "integer", "description": "How long to wait for the download in milliseconds, defaults to 60000"}
                 },
                 "required": ["selector"]
             }
         ),
+        types.Tool(
+            name="playwright_fetch_url",
+            description="Download a URL directly with the session's cookies, without clicking anything. The whole body is held in memory until it is stored, so prefer playwright_download_file for very large files",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "url": {"type": "string", "description": "URL to download"},
+                    "save_path": {"type": "string", "description": "Path where to save the downloaded file"},
+                    "wait": {"type": "boolean", "description": "Wait for the download to finish, defaults to true"},
+                    "timeout": {"type": "integer", "description": "How long to wait in milliseconds, defaults to 60000"}
+                },
+                "required": ["url"]
+            }
+        ),
+        types.Tool(
+            name="playwright_wait_for_download",
+            description="Wait for a download to finish and return its size, SHA-256 and path",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "download_id": {"type": "string", "description": "Download to wait for, defaults to the latest one or the next to start"},
+                    "save_path": {"type": "string", "description": "Path where to save the downloaded file"},
+                    "timeout": {"type": "integer", "description": "Timeout in milliseconds, defaults to 30000"}
+                }
+            }
+        ),
+        types.Tool(
+            name="playwright_list_downloads",
+            description="List the session's downloads with their state, size and SHA-256. The browser does not report progress, so bytes stays 0 until a download has finished transferring and is being stored",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
+        types.Tool(
+            name="playwright_batch",
+            description="Run a list of tool calls in order in one round trip and return per-step results and timings",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "description": "Tool calls to run in order",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "tool": {"type": "string", "description": "Name of the tool to call"},
+                                "arguments": {"type": "object", "description": "Arguments for the tool, ${name} in a string is replaced with the output of an earlier named step, the bare result for evaluate and call_script"},
+                                "name": {"type": "string", "description": "Store this step's text output under this name"}
+                            },
+                            "required": ["tool"]
+                        }
+                    },
+                    "on_error": {"type": "string", "enum": ["stop", "continue"], "description": "Stop at the first failing step or keep going, defaults to stop"}
+                },
+                "required": ["steps"]
+            }
+        ),
+        types.Tool(
+            name="playwright_record_start",
+            description="Start recording this session's tool calls into a replayable flow",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
+        types.Tool(
+            name="playwright_record_stop",
+            description="Stop recording and save the recorded tool calls to a replay file",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string", "description": "Where to save the replay file, defaults to recordings/<session_id>.json"}
+                }
+            }
+        ),
+        types.Tool(
+            name="playwright_replay",
+            description="Replay a recorded flow server-side, waiting on conditions instead of recorded sleeps. On failure returns the failing step and the remaining steps",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string", "description": "Replay file saved by playwright_record_stop"},
+                    "step_timeout": {"type": "integer", "description": "How long to wait for each step's element in milliseconds, defaults to 10000"}
+                },
+                "required": ["path"]
+            }
+        ),
+        types.Tool(
+            name="playwright_trace_start",
+            description="Start Playwright tracing for this session. With window_seconds the trace keeps rolling and playwright_trace_save captures the last window_seconds or more",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "screenshots": {"type": "boolean", "description": "Capture a screencast of the page, defaults to true"},
+                    "snapshots": {"type": "boolean", "description": "Capture DOM snapshots for every action, defaults to true"},
+                    "sources": {"type": "boolean", "description": "Include the source of the driving code, defaults to true"},
+                    "window_seconds": {"type": "number", "description": "Always keep the last N seconds instead of tracing from start to stop"}
+                }
+            }
+        ),
+        types.Tool(
+            name="playwright_trace_save",
+            description="Save what has been traced so far as trace:// resources and keep tracing",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
+        types.Tool(
+            name="playwright_trace_stop",
+            description="Stop tracing and save the trace as trace:// resources, viewable with playwright show-trace",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
     ]
+    # Every tool except session creation can be routed to a specific session
+    for tool in tools:
+        if tool.name != "playwright_new_session":
+            tool.inputSchema["properties"]["session_id"] = SESSION_ID_SCHEMA
+        if tool.name in FRAME_AWARE_TOOLS:
+            tool.inputSchema["properties"]["frame"] = FRAME_SCHEMA
+    return tools
 
 import uuid
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import base64
+import hashlib
+import json
 import os
+import re
+import shutil
+import argparse
+import contextlib
+import signal
+import time
+import bisect
+import contextvars
+from collections import OrderedDict
 
 import asyncio
 
-def update_page_after_click(func):
-    async def wrapper(self, name: str, arguments: dict | None):
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        
-        # Store the current pages before the click
-        context = page.context
-        pages_before = context.pages
-        
-        # Set up future for new page event
-        new_page_future = asyncio.ensure_future(context.wait_for_event("page", timeout=3000))
-        
-        result = await func(self, name, arguments)
-        
-        try:
-            # Try to get the new page from the event
-            new_page = await new_page_future
-            await new_page.wait_for_load_state()
-            self._sessions[session_id]["page"] = new_page
-        except:
-            # If that fails, check if there are any new pages
-            pages_after = context.pages
-            new_pages = [p for p in pages_after if p not in pages_before]
-            
-            if new_pages:
-                # Use the last new page
-                new_page = new_pages[-1]
-                await new_page.wait_for_load_state()
-                self._sessions[session_id]["page"] = new_page
-            else:
-                # If no new pages, check if the URL changed
-                if page.url != self._sessions[session_id]["page"].url:
-                    await page.wait_for_load_state()
-                    self._sessions[session_id]["page"] = page
-        
-        return result
-    return wrapper
+# Browser pool settings, overridable from the environment so deployments can
+# size the warm pool without code changes.
+POOL_MIN_SIZE = int(os.environ.get("PLAYWRIGHT_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.environ.get("PLAYWRIGHT_POOL_MAX", "32"))
+BROWSER_COUNT = int(os.environ.get("PLAYWRIGHT_BROWSERS", "1"))
+HEADLESS = os.environ.get("PLAYWRIGHT_HEADLESS", "false").lower() in ("1", "true", "yes")
+# Saved storage states (cookies, localStorage, IndexedDB) live here, one JSON file per profile.
+# Warm contexts start from POOL_PROFILE when it is set, so pooled sessions are already logged in.
+PROFILES_DIR = os.environ.get("PLAYWRIGHT_PROFILES_DIR", "profiles")
+POOL_PROFILE = os.environ.get("PLAYWRIGHT_POOL_PROFILE") or None
+# Attach to an already running Chrome (e.g. http://localhost:9222) instead of launching browsers
+CDP_URL = os.environ.get("PLAYWRIGHT_CDP_URL") or None
+CDP_RECONNECT_MAX_DELAY = 10
+# Session lifecycle: creating a session beyond MAX_SESSIONS evicts the least recently
+# used idle one, and sessions unused for SESSION_IDLE_TTL seconds are closed (0 disables either).
+MAX_SESSIONS = int(os.environ.get("PLAYWRIGHT_MAX_SESSIONS", str(POOL_MAX_SIZE)))
+SESSION_IDLE_TTL = float(os.environ.get("PLAYWRIGHT_SESSION_IDLE_TTL", "900"))
 
-class ToolHandler:
-    _sessions: dict[str, any] = {}
-    _playwright: any = None
+def _profile_path(profile: str) -> str:
+    if not re.fullmatch(r"[\w.-]+", profile):
+        raise ValueError(f"Invalid profile name: {profile}")
+    return os.path.join(PROFILES_DIR, f"{profile}.json")
 
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        raise NotImplementedError
+class BrowserPool:
+    """
+    One shared Playwright driver running a small number of browsers.
+    Each session gets its own BrowserContext (isolated cookies and storage) on the
+    least loaded browser. A few contexts with a ready page are kept warm so
+    sessions check them out instead of waiting on context creation, and the
+    pool refills itself in the background up to min_size idle contexts.
 
-class NewSessionToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        self._playwright = await async_playwright().start()
-        browser = await self._playwright.chromium.launch(headless=False)
-        page = await browser.new_page()
-        session_id = str(uuid.uuid4())
-        self._sessions[session_id] = {"browser": browser, "page": page}
-        url = arguments.get("url")
-        if url:
-            if not url.startswith("http://") and not url.startswith("https://"):
-                url = "https://" + url
-            await page.goto(url)
-        return [types.TextContent(type="text", text="succ")]
+    With a cdp_url the pool attaches to a running Chrome over CDP instead of
+    launching browsers, and reconnects with backoff when the connection drops.
+    on_connect is called with the browser after every (re)connect so its
+    existing contexts can be adopted as sessions.
+    """
 
-class NavigateToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            await NewSessionToolHandler().handle("",{})
-            # return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        url = arguments.get("url")
-        if not url.startswith("http://") and not url.startswith("https://"):
-            url = "https://" + url
-        await page.goto(url)
-        text_content=await GetTextContentToolHandler().handle("",{})
-        return [types.TextContent(type="text", text=f"Navigated to {url}\npage_text_content[:200]:\n\n{text_content[:200]}")]
+    def __init__(self, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 browser_count: int = BROWSER_COUNT, headless: bool = HEADLESS, profile: str | None = POOL_PROFILE,
+                 cdp_url: str | None = CDP_URL):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.browser_count = max(browser_count, 1)
+        self.headless = headless
+        self.profile = profile
+        self.cdp_url = cdp_url
+        self.on_connect = None
+        self._closed = False
+        self._reconnect_task: asyncio.Task | None = None
+        self._playwright = None
+        self._browsers: list = []
+        self._idle: list[dict] = []
+        self._launching: set[asyncio.Task] = set()
+        # Acquirers currently waiting for a warm launch to finish
+        self._waiting = 0
+        self._in_use = 0
+        self._start_lock = asyncio.Lock()
+        self._browser_lock = asyncio.Lock()
 
-class ScreenshotToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        name = arguments.get("name")
-        selector = arguments.get("selector")
-        # full_page = arguments.get("fullPage", False)
-        if selector:
-            element = await page.locator(selector)
-            await element.screenshot(path=f"{name}.png")
-        else:
-            await page.screenshot(path=f"{name}.png", full_page=True)
-        with open(f"{name}.png", "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-        #os.remove(f"{name}.png")
-        return [types.ImageContent(type="image", data=encoded_string, mimeType="image/png")]
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._launching) + self._in_use
 
-class ClickToolHandler(ToolHandler):
-    @update_page_after_click
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        selector = arguments.get("selector")
-        await page.locator(selector).click()
-        return [types.TextContent(type="text", text=f"Clicked element with selector {selector}")]
+    async def start(self):
+        async with self._start_lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+                if self.cdp_url:
+                    # Attach right away so the browser's existing tabs show up as sessions
+                    self._reconnect_task = asyncio.create_task(self._reconnect())
+        self._schedule_refill()
 
-class FillToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        # Use the current frame if set, otherwise use the page
-        context = self._sessions[session_id].get("frame", page)
-        
+    async def _connect_cdp(self):
+        browser = await self._playwright.chromium.connect_over_cdp(self.cdp_url)
+        browser.on("disconnected", self._on_disconnected)
+        self._browsers = [browser]
+        # Warm contexts belonged to the old connection
+        self._idle.clear()
+        if self.on_connect is not None:
+            await self.on_connect(browser)
+        return browser
+
+    def _on_disconnected(self, _browser):
+        if not self._closed and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        while not self._closed:
+            try:
+                async with self._browser_lock:
+                    if not (self._browsers and self._browsers[0].is_connected()):
+                        await self._connect_cdp()
+                self._schedule_refill()
+                return
+            except Exception:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, CDP_RECONNECT_MAX_DELAY)
+
+    async def _browser(self):
+        """Return the connected browser with the fewest contexts, relaunching any that died."""
+        async with self._browser_lock:
+            if self.cdp_url:
+                if not (self._browsers and self._browsers[0].is_connected()):
+                    await self._connect_cdp()
+                return self._browsers[0]
+            self._browsers = [b for b in self._browsers if b.is_connected()]
+            missing = self.browser_count - len(self._browsers)
+            if missing > 0:
+                launched = await asyncio.gather(
+                    *(self._playwright.chromium.launch(headless=self.headless) for _ in range(missing))
+                )
+                self._browsers.extend(launched)
+            return min(self._browsers, key=lambda b: len(b.contexts))
+
+    async def _launch(self, profile: str | None = None) -> dict:
+        browser = await self._browser()
+        profile = profile or self.profile
+        storage_state = None
+        if profile:
+            storage_state = _profile_path(profile)
+            if not os.path.exists(storage_state):
+                if profile != self.profile:
+                    raise ValueError(f"Unknown profile: {profile}")
+                # The pool profile has not been saved yet, start blank until it is
+                storage_state = None
+        context = await browser.new_context(storage_state=storage_state)
+        await _prepare_context(context)
+        page = await context.new_page()
+        return {"browser": browser, "context": context, "page": page}
+
+    def _schedule_refill(self):
+        while len(self._idle) + len(self._launching) < self.min_size and self.size < self.max_size:
+            task = asyncio.create_task(self._launch())
+            self._launching.add(task)
+            task.add_done_callback(self._on_launched)
+
+    def _on_launched(self, task: asyncio.Task):
+        self._launching.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            self._idle.append(task.result())
+
+    async def acquire(self, profile: str | None = None) -> dict:
+        await self.start()
+        if profile and profile != self.profile:
+            # Warm contexts carry the pool profile, any other one gets a fresh context
+            self._in_use += 1
+            try:
+                return await self._launch(profile)
+            except Exception:
+                self._in_use -= 1
+                raise
+        while True:
+            while self._idle:
+                entry = self._idle.pop()
+                if entry["browser"].is_connected():
+                    self._in_use += 1
+                    self._schedule_refill()
+                    return entry
+            if len(self._launching) > self._waiting or (self._launching and self.size >= self.max_size):
+                # A warm context no one else is waiting for is on its way, waiting for it
+                # beats creating a second one. Past that, bursts launch in parallel.
+                self._waiting += 1
+                try:
+                    done, _ = await asyncio.wait(self._launching, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    self._waiting -= 1
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                continue
+            if self.size >= self.max_size:
+                raise RuntimeError(f"Browser pool exhausted ({self.max_size} contexts in use)")
+            self._in_use += 1
+            try:
+                entry = await self._launch()
+            except Exception:
+                self._in_use -= 1
+                raise
+            self._schedule_refill()
+            return entry
+
+    async def release(self, entry: dict):
+        if entry.get("adopted"):
+            # Contexts adopted from an attached browser belong to its user and are left open
+            return
+        # Contexts are cheap to create, so a returned one is closed rather than scrubbed for reuse
+        self._in_use -= 1
         try:
-            selector = arguments.get("selector")
-            value = arguments.get("value")
-            await context.locator(selector).fill(value)
-            return [types.TextContent(type="text", text=f"Filled element with selector {selector} with value {value}")]
-        except Exception as e:
-            return [types.TextContent(type="text", text=f"Error filling element: {str(e)}")]
+            await entry["context"].close()
+        except Exception:
+            pass
+        self._schedule_refill()
 
-class EvaluateToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        script = arguments.get("script")
-        result = await page.evaluate(script)
-        return [types.TextContent(type="text", text=f"Evaluated script, result: {result}")]
+    async def refresh_idle(self):
+        """Replace warm contexts, e.g. after the pool profile was saved again."""
+        idle, self._idle = self._idle, []
+        for entry in idle:
+            try:
+                await entry["context"].close()
+            except Exception:
+                pass
+        self._schedule_refill()
 
-class ClickTextToolHandler(ToolHandler):
-    @update_page_after_click
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        text = arguments.get("text")
-        await page.locator(f"text={text}").nth(0).click()
-        return [types.TextContent(type="text", text=f"Clicked element with text {text}")]
+    def contexts(self) -> list:
+        """Every open context of the pool's browsers, idle or checked out."""
+        return [context for browser in self._browsers if browser.is_connected() for context in browser.contexts]
 
-class GetTextContentToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        # text_contents = await page.locator('body').all_inner_texts()
+    async def close(self):
+        self._closed = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        for task in list(self._launching):
+            task.cancel()
+        self._idle.clear()
+        for browser in self._browsers:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self._browsers.clear()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
 
+browser_pool = BrowserPool()
 
-        async def get_unique_texts_js(page):
-            unique_texts = await page.evaluate('''() => {
-            var elements = Array.from(document.querySelectorAll('*')); // 先选择所有元素，再进行过滤
-            var uniqueTexts = new Set();
+# Named in-page scripts. Every context gets the helper library and all
+# registered scripts as an init script, so callers invoke them by name instead
+# of re-sending source on every call.
+script_registry: dict[str, str] = {}
 
-            for (var element of elements) {
-                if (element.offsetWidth > 0 || element.offsetHeight > 0) { // 判断是否可见
-                    var childrenCount = element.querySelectorAll('*').length;
-                    if (childrenCount <= 3) {
-                        var innerText = element.innerText ? element.innerText.trim() : '';
-                        if (innerText && innerText.length <= 1000) {
-                            uniqueTexts.add(innerText);
-                        }
-                        var value = element.getAttribute('value');
-                        if (value) {
-                            uniqueTexts.add(value);
-                        }
-                    }
-                }
-            }
-            //console.log( Array.from(uniqueTexts));
-            return Array.from(uniqueTexts);
+SCRIPT_HELPERS_JS = '''(() => {
+    const scripts = window.__mcpScripts = window.__mcpScripts || {};
+    scripts.exists = (selector) => document.querySelector(selector) !== null;
+    scripts.count = (selector) => document.querySelectorAll(selector).length;
+    scripts.texts = (selector, limit = 100) => Array.from(document.querySelectorAll(selector))
+        .slice(0, limit).map(el => (el.textContent || '').replace(/\\s+/g, ' ').trim());
+    scripts.attributes = (selector) => {
+        const el = document.querySelector(selector);
+        return el ? Object.fromEntries(Array.from(el.attributes).map(a => [a.name, a.value])) : null;
+    };
+    scripts.rect = (selector) => {
+        const el = document.querySelector(selector);
+        if (!el) {
+            return null;
+        }
+        const {x, y, width, height} = el.getBoundingClientRect();
+        return {x, y, width, height};
+    };
+    scripts.scroll_into_view = (selector) => {
+        const el = document.querySelector(selector);
+        if (el) {
+            el.scrollIntoView({block: 'center'});
         }
-        ''')
-            return unique_texts
+        return el !== null;
+    };
+})();'''
 
-        # 使用示例
-        text_contents = await get_unique_texts_js(page)
+CALL_SCRIPT_JS = '''([name, args]) => {
+    const fn = window.__mcpScripts && window.__mcpScripts[name];
+    if (!fn) {
+        return {__mcpMissing: true};
+    }
+    return fn(...args);
+}'''
 
+def _script_source(name: str, source: str) -> str:
+    # Ends in undefined, frame.evaluate would otherwise call the function the assignment evaluates to
+    return f"(window.__mcpScripts = window.__mcpScripts || {{}})[{json.dumps(name)}] = ({source});\nundefined;"
 
+def _init_script_source() -> str:
+    return "\n".join([SCRIPT_HELPERS_JS] + [_script_source(name, source) for name, source in script_registry.items()])
 
-        return [types.TextContent(type="text", text=f"Text content of all elements: {text_contents}")]
+async def _prepare_context(context):
+    """Set up a freshly created context before any session uses it."""
+    await context.add_init_script(script=_init_script_source())
 
-class GetHtmlContentToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        selector = arguments.get("selector")
-        html_content = await page.locator(selector).inner_html()
-        return [types.TextContent(type="text", text=f"HTML content of element with selector {selector}: {html_content}")]
+# Post-click detection: without an explicit expect hint a click waits at most a
+# short grace window for a popup or navigation. The window adapts per session to
+# how quickly its clicks have actually produced one.
+CLICK_GRACE_MIN_MS = 100
+CLICK_GRACE_MAX_MS = 1500
+CLICK_EXPECT_TIMEOUT_MS = 10000
 
-class ListPagesToolHandler(ToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        context = self._sessions[session_id]["page"].context
-        pages = context.pages
-        
-        page_info = []
-        for i, page in enumerate(pages):
-            page_info.append(f"Page {i}: URL={page.url}, Title={await page.title()}")
-        
-        return [types.TextContent(type="text", text=f"Available pages: {page_info}")]
+def update_page_after_click(func):
+    async def wrapper(self, name: str, arguments: dict | None):
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        session = self._sessions[session_id]
+        page = session["page"]
+        # Pin the wrapped handler to the same session even if another one is created meanwhile
+        arguments = {**(arguments or {}), "session_id": session_id}
+        expect = arguments.get("expect", "auto")
+        if expect == "none":
+            return await func(self, name, arguments)
+
+        context = page.context
+        loop = asyncio.get_running_loop()
+        popup_future = loop.create_future()
+        navigation_future = loop.create_future()
+
+        def on_page(new_page):
+            if not popup_future.done():
+                popup_future.set_result(new_page)
+
+        def on_navigated(frame):
+            if frame == page.main_frame and not navigation_future.done():
+                navigation_future.set_result(frame)
+
+        # A newer click replaces any popup an older one might still open
+        session.pop("click_pages", None)
+        pages_before = list(context.pages)
+        # Listen before clicking so events fired during the click itself are not missed
+        context.on("page", on_page)
+        page.on("framenavigated", on_navigated)
+        try:
+            result = await func(self, name, arguments)
+            clicked_at = loop.time()
+
+            if expect == "popup":
+                futures, timeout = [popup_future], CLICK_EXPECT_TIMEOUT_MS
+            elif expect == "navigation":
+                futures, timeout = [navigation_future], CLICK_EXPECT_TIMEOUT_MS
+            else:
+                futures, timeout = [popup_future, navigation_future], _click_grace_ms(session)
+            await asyncio.wait(futures, timeout=timeout / 1000, return_when=asyncio.FIRST_COMPLETED)
+            elapsed_ms = (loop.time() - clicked_at) * 1000
+
+            if popup_future.done():
+                new_page = popup_future.result()
+                await new_page.wait_for_load_state("domcontentloaded")
+                session["page"] = new_page
+                session.pop("frame", None)
+                _record_click_event(session, elapsed_ms)
+            elif navigation_future.done():
+                await page.wait_for_load_state("domcontentloaded")
+                session.pop("frame", None)
+                _record_click_event(session, elapsed_ms)
+            else:
+                _record_click_event(session, None)
+                if expect != "navigation":
+                    # A popup that opens after the window is adopted on the session's next call
+                    session["click_pages"] = (pages_before, clicked_at)
+                if expect in ("popup", "navigation"):
+                    result = result + [types.TextContent(type="text", text=f"No {expect} detected within {timeout} ms")]
+        finally:
+            context.remove_listener("page", on_page)
+            page.remove_listener("framenavigated", on_navigated)
+
+        return result
+    return wrapper
+
+async def _adopt_late_popup(session: dict | None):
+    """Switch to a page the last click opened after its wait ended, if any."""
+    if session is None or "click_pages" not in session:
+        return
+    pages_before, clicked_at = session.pop("click_pages")
+    elapsed_ms = (asyncio.get_running_loop().time() - clicked_at) * 1000
+    new_pages = [page for page in session["context"].pages if page not in pages_before and not page.is_closed()]
+    if not new_pages:
+        if elapsed_ms < CLICK_EXPECT_TIMEOUT_MS:
+            # Still within the time an explicit popup wait allows, look again on the next call
+            session["click_pages"] = (pages_before, clicked_at)
+        return
+    await new_pages[-1].wait_for_load_state("domcontentloaded")
+    session["page"] = new_pages[-1]
+    session.pop("frame", None)
+    _record_click_event(session, elapsed_ms)
+
+def _click_grace_ms(session: dict) -> float:
+    # Allow twice the typical delay seen for this session's click side effects
+    return min(max(session.get("click_event_ms", 150) * 2, CLICK_GRACE_MIN_MS), CLICK_GRACE_MAX_MS)
+
+def _record_click_event(session: dict, elapsed_ms: float | None):
+    previous = session.get("click_event_ms", 150)
+    if elapsed_ms is None:
+        # Nothing happened, shrink the window so clicks that open nothing return sooner
+        session["click_event_ms"] = previous * 0.8
+    else:
+        session["click_event_ms"] = previous * 0.5 + elapsed_ms * 0.5
+
+def _frame_tree(session: dict) -> list[dict]:
+    """
+    Frames of the session's current page in document order, each with its path
+    from the main frame. The tree is cached per page until a frame is attached,
+    detached or navigated.
+    """
+    page = session["page"]
+    caches = session.setdefault("frame_trees", {})
+    cache = caches.get(page)
+    if cache is None:
+        cache = caches[page] = {"tree": None}
+
+        def invalidate(_frame):
+            cache["tree"] = None
+
+        for event in ("frameattached", "framedetached", "framenavigated"):
+            page.on(event, invalidate)
+    if cache["tree"] is None:
+        tree = []
+
+        def walk(frame, path, depth):
+            tree.append({"path": path, "frame": frame, "depth": depth})
+            for index, child in enumerate(frame.child_frames):
+                segment = child.name or str(index)
+                walk(child, f"{path}>{segment}" if path else segment, depth + 1)
+
+        walk(page.main_frame, "", 0)
+        cache["tree"] = tree
+    return cache["tree"]
+
+def _resolve_frame_path(session: dict, path: str):
+    """
+    Find a frame by path, a '>' separated list of frame names or child indexes
+    starting below the main frame. A single name also matches a frame at any depth.
+    """
+    tree = _frame_tree(session)
+    for entry in tree:
+        if entry["path"] == path:
+            return entry["frame"]
+    if ">" not in path:
+        for entry in tree:
+            if entry["frame"].name == path:
+                return entry["frame"]
+    return None
+
+class ToolHandler:
+    _sessions: dict[str, any] = {}
+    _session_lock = asyncio.Lock()
+
+    def _session_id(self, arguments: dict | None) -> str | None:
+        """
+        Resolve the session a call targets.
+        An explicit session_id must exist; without one the most recently created session is used.
+        """
+        session_id = (arguments or {}).get("session_id")
+        if session_id:
+            return session_id if session_id in self._sessions else None
+        if not self._sessions:
+            return None
+        return list(self._sessions.keys())[-1]
+
+    def _no_session(self, arguments: dict | None) -> list[types.TextContent]:
+        session_id = (arguments or {}).get("session_id")
+        if session_id:
+            reason = session_lifecycle.closed.get(session_id)
+            if reason:
+                return [types.TextContent(type="text", text=f"Unknown session: {session_id} was closed ({reason})")]
+            return [types.TextContent(type="text", text=f"Unknown session: {session_id}")]
+        return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
+
+    def _selector(self, arguments: dict) -> str | None:
+        """CSS selector for the element a call targets, a snapshot ref takes precedence over selector."""
+        ref = arguments.get("ref")
+        if ref:
+            return f'[data-mcp-ref="{ref}"]'
+        return arguments.get("selector")
+
+    def _target(self, session_id: str, arguments: dict):
+        """
+        Frame a call runs against: an explicit frame path, else the frame selected
+        with playwright_frame, else the page's main frame.
+        """
+        session = self._sessions[session_id]
+        page = session["page"]
+        path = arguments.get("frame")
+        if path:
+            frame = _resolve_frame_path(session, path)
+            if frame is None:
+                raise ValueError(f"Frame with path '{path}' not found")
+            return frame
+        frame = session.get("frame")
+        if frame is None or frame.is_detached() or frame.page is not page:
+            return page.main_frame
+        return frame
+
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        raise NotImplementedError
+
+def _session_state(entry: dict) -> dict:
+    """Per-session state for a context checked out of the browser pool."""
+    return {
+        "browser": entry["browser"], "context": entry["context"], "page": entry["page"], "pool_entry": entry,
+        "downloads": DownloadManager(entry["context"]),
+        "last_used": time.monotonic(), "active_calls": 0,
+    }
+
+def _move_session(session: dict, entry: dict):
+    """
+    Point a live session at another context. Lifecycle bookkeeping stays with the
+    session, while per-context state (selected frame, tracing) goes with the old context.
+    """
+    state = _session_state(entry)
+    for key in ("browser", "context", "page", "pool_entry", "downloads"):
+        session[key] = state[key]
+    session.pop("frame", None)
+    session.pop("click_pages", None)
+    tracer = session.pop("tracer", None)
+    if tracer is not None:
+        tracer.cancel()
+
+async def _adopt_contexts(browser):
+    """
+    Expose the contexts of a browser attached over CDP as sessions cdp-0, cdp-1, ...
+    The ids stay the same across reconnects, so callers can keep using them.
+    """
+    for index, context in enumerate(browser.contexts):
+        await _prepare_context(context)
+        page = context.pages[0] if context.pages else await context.new_page()
+        entry = {"browser": browser, "context": context, "page": page, "adopted": True}
+        session = ToolHandler._sessions.get(f"cdp-{index}")
+        if session is None:
+            ToolHandler._sessions[f"cdp-{index}"] = _session_state(entry)
+        else:
+            # A reconnect, calls may still be running on the session
+            _move_session(session, entry)
+
+browser_pool.on_connect = _adopt_contexts
+
+async def _close_session(session_id: str):
+    session = ToolHandler._sessions.pop(session_id, None)
+    if session is not None:
+        if session.get("tracer") is not None:
+            # An unsaved trace goes away with its context
+            session["tracer"].cancel()
+        await browser_pool.release(session["pool_entry"])
+
+class SessionLifecycle:
+    """
+    Bounds how many sessions are open and for how long. Sessions are only closed
+    between calls, never while one of their tool calls is running. Sessions adopted
+    from an attached browser belong to its user and are neither counted nor reaped.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evicted = 0
+        self.reaped = 0
+        # Why recently closed sessions went away, so callers still using one can be told
+        self.closed: OrderedDict[str, str] = OrderedDict()
+        # Sessions being created, counted against the limit before they are registered
+        self._reserved = 0
+        self._reaper: asyncio.Task | None = None
+
+    def start(self):
+        if self.idle_ttl > 0:
+            self._reaper = asyncio.create_task(self._reap())
+
+    @contextlib.contextmanager
+    def in_use(self, session: dict):
+        session["active_calls"] += 1
+        try:
+            yield
+        finally:
+            session["active_calls"] -= 1
+            session["last_used"] = time.monotonic()
+
+    def _owned(self) -> list[tuple[str, dict]]:
+        return [
+            (session_id, session) for session_id, session in ToolHandler._sessions.items()
+            if not session["pool_entry"].get("adopted")
+        ]
+
+    @contextlib.asynccontextmanager
+    async def reserve(self):
+        """Hold a slot for a session while it is created."""
+        await self._make_room()
+        self._reserved += 1
+        try:
+            yield
+        finally:
+            self._reserved -= 1
+
+    async def _make_room(self):
+        """Evict least recently used idle sessions until one more fits under max_sessions."""
+        if self.max_sessions <= 0:
+            return
+        owned = self._owned()
+        while len(owned) + self._reserved >= self.max_sessions:
+            idle = [(session_id, session) for session_id, session in owned if session["active_calls"] == 0]
+            if not idle:
+                raise RuntimeError(f"Session limit of {self.max_sessions} reached and no session is idle")
+            session_id, _ = min(idle, key=lambda item: item[1]["last_used"])
+            await _close_session(session_id)
+            self.evicted += 1
+            self._closed(session_id, "evicted")
+            owned = self._owned()
+
+    async def _reap(self):
+        interval = min(max(self.idle_ttl / 4, 1), 30)
+        while True:
+            await asyncio.sleep(interval)
+            deadline = time.monotonic() - self.idle_ttl
+            for session_id, session in self._owned():
+                if session["active_calls"] == 0 and session["last_used"] < deadline:
+                    try:
+                        await _close_session(session_id)
+                    except Exception:
+                        pass
+                    self.reaped += 1
+                    self._closed(session_id, "idle")
+
+    def _closed(self, session_id: str, reason: str):
+        self.closed[session_id] = reason
+        while len(self.closed) > 1000:
+            self.closed.popitem(last=False)
+
+    async def close(self):
+        """Close every session, used on shutdown before the pool stops its browsers and driver."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for session_id in list(ToolHandler._sessions):
+            try:
+                await _close_session(session_id)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        owned = self._owned()
+        return {
+            "sessions": len(owned),
+            "busy": sum(1 for _, session in owned if session["active_calls"]),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "evicted": self.evicted,
+            "reaped": self.reaped,
+        }
+
+session_lifecycle = SessionLifecycle()
+
+# Network transports serve many clients from one process. Each client connection
+# runs inside its own Connection, bound to the browser sessions it creates: calls
+# without a session_id go to its newest session instead of the most recent one
+# overall, it only sees its own resources, and its sessions close with it.
+class Connection:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.session_ids: list[str] = []
+        # Concurrent first calls on one connection must create a single session
+        self.lock = asyncio.Lock()
+
+    def session(self) -> str | None:
+        live = [session_id for session_id in self.session_ids if session_id in ToolHandler._sessions]
+        return live[-1] if live else None
+
+    def lost_session(self) -> tuple[str, str] | None:
+        """The newest session if the server closed it under the client, with the reason."""
+        if self.session_ids and self.session_ids[-1] in session_lifecycle.closed:
+            return self.session_ids[-1], session_lifecycle.closed[self.session_ids[-1]]
+        return None
+
+    async def close(self):
+        for session_id in self.session_ids:
+            try:
+                await _close_session(session_id)
+            except Exception:
+                pass
+        for document_id in [document_id for document_id, document in html_documents.items() if document["owner"] == self.id]:
+            del html_documents[document_id]
+
+# Set for the duration of each network client connection, request handlers inherit it
+current_connection: contextvars.ContextVar[Connection | None] = contextvars.ContextVar("current_connection", default=None)
+# Tools that do not act on a session never create one for a connection
+SESSIONLESS_TOOLS = {"playwright_new_session", "playwright_register_script"}
+
+def _bind_connection(session_id: str):
+    connection = current_connection.get()
+    if connection is not None:
+        connection.session_ids.append(session_id)
+
+def _owner() -> str | None:
+    """Id of the connection that owns a stored resource, None on stdio where there is only one client."""
+    connection = current_connection.get()
+    return connection.id if connection is not None else None
+
+async def _run_connection(read_stream, write_stream, init_options, **kwargs):
+    """Serve one network client and close its browser sessions as soon as it goes away."""
+    connection = Connection()
+    token = current_connection.set(connection)
+    try:
+        await server.run(read_stream, write_stream, init_options, **kwargs)
+    finally:
+        current_connection.reset(token)
+        await connection.close()
+
+class NewSessionToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        try:
+            session_id = await self.create(arguments or {})
+        except RuntimeError as e:
+            return [types.TextContent(type="text", text=f"Error: {e}")]
+        return [types.TextContent(type="text", text=f"Created session {session_id}")]
+
+    async def create(self, arguments: dict) -> str:
+        async with session_lifecycle.reserve():
+            entry = await browser_pool.acquire(arguments.get("profile"))
+            page = entry["page"]
+            session_id = str(uuid.uuid4())
+            self._sessions[session_id] = _session_state(entry)
+        _bind_connection(session_id)
+        url = arguments.get("url")
+        if url:
+            if not url.startswith("http://") and not url.startswith("https://"):
+                url = "https://" + url
+            await page.goto(url)
+        return session_id
+
+class CloseSessionToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        await _close_session(session_id)
+        return [types.TextContent(type="text", text=f"Closed session {session_id}")]
+
+class SaveStorageStateToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        profile = arguments.get("profile")
+        path = _profile_path(profile)
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        state = await self._sessions[session_id]["context"].storage_state(path=path, indexed_db=True)
+        if profile == browser_pool.profile:
+            await browser_pool.refresh_idle()
+        return [types.TextContent(type="text", text=f"Saved {len(state['cookies'])} cookies and {len(state['origins'])} origins to profile {profile}")]
+
+class LoadStorageStateToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        profile = arguments.get("profile")
+        # Storage cannot be fully restored into a live context, so the session moves to a new one
+        entry = await browser_pool.acquire(profile)
+        session = self._sessions[session_id]
+        old_entry = session["pool_entry"]
+        url = session["page"].url
+        _move_session(session, entry)
+        await browser_pool.release(old_entry)
+        if arguments.get("reload", True) and url.startswith(("http://", "https://")):
+            await entry["page"].goto(url, wait_until="domcontentloaded")
+        return [types.TextContent(type="text", text=f"Loaded profile {profile} into session {session_id}")]
+
+class NavigateToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        if not arguments.get("session_id"):
+            # Auto create a session for clients that never call playwright_new_session
+            async with self._session_lock:
+                if not self._sessions:
+                    await NewSessionToolHandler().handle("", {})
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        page = self._sessions[session_id]["page"]
+        url = arguments.get("url")
+        if not url.startswith("http://") and not url.startswith("https://"):
+            url = "https://" + url
+        with tool_metrics.phase("goto"):
+            await page.goto(url, wait_until=arguments.get("wait_until", "domcontentloaded"))
+        # Frames of the previous document are gone after a navigation
+        self._sessions[session_id].pop("frame", None)
+
+        # The summary is only computed when asked for, the default title costs one round trip
+        summary = arguments.get("summary", "title")
+        if summary == "title":
+            with tool_metrics.phase("summary"):
+                title = await page.title()
+            return [types.TextContent(type="text", text=f"Navigated to {url}\nTitle: {title}")]
+        if summary == "text":
+            chars = arguments.get("summary_chars", 200)
+            with tool_metrics.phase("summary"):
+                result = await page.evaluate(TEXT_EXTRACT_JS, {"maxNodes": 20000, "maxChars": chars, "maxTimeMs": 500})
+            text = " ".join(result["texts"])[:chars]
+            return [types.TextContent(type="text", text=f"Navigated to {url}\npage_text_content[:{chars}]:\n\n{text}")]
+        return [types.TextContent(type="text", text=f"Navigated to {url}")]
+
+IMAGE_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+class ScreenshotToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        page = self._sessions[session_id]["page"]
+        target = self._target(session_id, arguments)
+        selector = self._selector(arguments)
+        image_format = arguments.get("format", "png")
+        quality = arguments.get("quality") if image_format != "png" else None
+        clip = arguments.get("clip")
+        full_page = arguments.get("full_page", not clip)
+        max_width = arguments.get("max_width")
+        if selector:
+            element = target.locator(selector).first
+        elif target is not page.main_frame:
+            # Without a selector a frame is captured as its iframe element in the page
+            element = await target.frame_element()
+        else:
+            element = None
+
+        with tool_metrics.phase("capture"):
+            if max_width:
+                # Playwright cannot downscale, Chromium's CDP capture scales while encoding
+                data = await self._capture_cdp(
+                    page, element, image_format, quality, clip, full_page, max_width, arguments.get("scale", "device")
+                )
+            elif element is not None:
+                data = await element.screenshot(
+                    type=image_format, quality=quality, scale=arguments.get("scale", "device")
+                )
+            else:
+                data = await page.screenshot(
+                    type=image_format, quality=quality, full_page=full_page, clip=clip,
+                    scale=arguments.get("scale", "device"),
+                )
+
+        with tool_metrics.phase("encode"):
+            encoded = base64.b64encode(data).decode("utf-8")
+        result = [types.ImageContent(type="image", data=encoded, mimeType=IMAGE_MIME_TYPES[image_format])]
+        path = arguments.get("path")
+        if path:
+            with open(path, "wb") as image_file:
+                image_file.write(data)
+            result.append(types.TextContent(type="text", text=f"Screenshot saved to {path}"))
+        return result
+
+    async def _capture_cdp(self, page, element, image_format, quality, clip, full_page, max_width, scale_mode) -> bytes:
+        metrics = await page.evaluate('''() => ({
+            scrollX: window.scrollX,
+            scrollY: window.scrollY,
+            dpr: window.devicePixelRatio,
+            width: document.documentElement.scrollWidth,
+            height: document.documentElement.scrollHeight,
+            viewportWidth: window.innerWidth,
+            viewportHeight: window.innerHeight
+        })''')
+        # CDP clips are in document coordinates, while bounding boxes and caller clips are viewport relative
+        if element is not None:
+            box = await element.bounding_box()
+            if box is None:
+                raise ValueError("Element to screenshot is not visible")
+            region = {"x": box["x"] + metrics["scrollX"], "y": box["y"] + metrics["scrollY"], "width": box["width"], "height": box["height"]}
+        elif clip:
+            region = {"x": clip["x"] + metrics["scrollX"], "y": clip["y"] + metrics["scrollY"], "width": clip["width"], "height": clip["height"]}
+        elif full_page:
+            region = {"x": 0, "y": 0, "width": metrics["width"], "height": metrics["height"]}
+        else:
+            region = {"x": metrics["scrollX"], "y": metrics["scrollY"], "width": metrics["viewportWidth"], "height": metrics["viewportHeight"]}
+        # CDP renders clip size * scale * devicePixelRatio pixels, css output is one pixel per CSS pixel
+        pixel_ratio = 1 if scale_mode == "css" else metrics["dpr"]
+        if max_width and region["width"] * pixel_ratio > max_width:
+            pixel_ratio = max_width / region["width"]
+        scale = pixel_ratio / metrics["dpr"]
+        params = {"format": image_format, "clip": {**region, "scale": scale}, "captureBeyondViewport": True}
+        if quality is not None:
+            params["quality"] = quality
+        cdp = await page.context.new_cdp_session(page)
+        try:
+            response = await cdp.send("Page.captureScreenshot", params)
+        finally:
+            await cdp.detach()
+        return base64.b64decode(response["data"])
+
+class ClickToolHandler(ToolHandler):
+    @update_page_after_click
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        target = self._target(session_id, arguments)
+        selector = self._selector(arguments)
+        await target.locator(selector).click()
+        return [types.TextContent(type="text", text=f"Clicked element with selector {selector}")]
+
+class FillToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        try:
+            target = self._target(session_id, arguments)
+            selector = self._selector(arguments)
+            value = arguments.get("value")
+            await target.locator(selector).fill(value)
+            return [types.TextContent(type="text", text=f"Filled element with selector {selector} with value {value}")]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Error filling element: {str(e)}")]
+
+class EvaluateToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        target = self._target(session_id, arguments)
+        script = arguments.get("script")
+        with tool_metrics.phase("evaluate"):
+            result = await target.evaluate(script)
+        with tool_metrics.phase("serialize"):
+            text = json.dumps(result, default=str)
+        return [types.TextContent(type="text", text=f"Evaluated script, result: {text}")]
+
+class RegisterScriptToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        script_name = arguments.get("name")
+        source = _script_source(script_name, arguments.get("source"))
+        script_registry[script_name] = arguments.get("source")
+        # Init scripts only reach documents loaded later, so also install into what is already open
+        for context in browser_pool.contexts():
+            await context.add_init_script(script=source)
+            for page in context.pages:
+                for frame in page.frames:
+                    try:
+                        await frame.evaluate(source)
+                    except Exception:
+                        pass
+        return [types.TextContent(type="text", text=f"Registered script {script_name}, available scripts: {sorted(script_registry)}")]
+
+class CallScriptToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        target = self._target(session_id, arguments)
+        script_name = arguments.get("name")
+        call = [script_name, arguments.get("args", [])]
+        result = await target.evaluate(CALL_SCRIPT_JS, call)
+        if isinstance(result, dict) and result.get("__mcpMissing"):
+            # A document that predates the init script, install the library once and retry
+            await target.evaluate(_init_script_source())
+            result = await target.evaluate(CALL_SCRIPT_JS, call)
+            if isinstance(result, dict) and result.get("__mcpMissing"):
+                return [types.TextContent(type="text", text=f"Error: unknown script {script_name}")]
+        return [types.TextContent(type="text", text=json.dumps(result, default=str))]
+
+class ClickTextToolHandler(ToolHandler):
+    @update_page_after_click
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        target = self._target(session_id, arguments)
+        text = arguments.get("text")
+        await target.locator(f"text={text}").nth(0).click()
+        return [types.TextContent(type="text", text=f"Clicked element with text {text}")]
+
+class GetTextContentToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        target = self._target(session_id, arguments)
+        limits = {
+            "maxNodes": arguments.get("max_nodes", 20000),
+            "maxChars": arguments.get("max_chars", 100000),
+            "maxTimeMs": arguments.get("max_time_ms", 2000),
+        }
+        with tool_metrics.phase("evaluate"):
+            result = await target.evaluate(TEXT_EXTRACT_JS, limits)
+        text = f"Text content of all elements: {result['texts']}"
+        if result["truncated"]:
+            text += f"\n(truncated after {result['nodes']} nodes: {result['truncated']} limit reached)"
+        return [types.TextContent(type="text", text=text)]
+
+# Single TreeWalker pass over the visible DOM in document order. Visibility is
+# decided once per element from its computed style, hidden subtrees are skipped
+# whole, and nothing reads layout (offsetWidth/innerText) so the walk never forces reflow.
+TEXT_EXTRACT_JS = '''({maxNodes, maxChars, maxTimeMs}) => {
+    const started = performance.now();
+    const skipTags = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE', 'HEAD', 'SVG']);
+    const seen = new Set();
+    const texts = [];
+    let chars = 0;
+    let nodes = 0;
+    let truncated = null;
+
+    function add(text) {
+        if (truncated) {
+            return;
+        }
+        text = text.replace(/\\s+/g, ' ').trim();
+        if (!text || text.length > 1000 || seen.has(text)) {
+            return;
+        }
+        if (chars + text.length > maxChars) {
+            // Keep what still fits, so the result really is the first maxChars characters
+            if (chars < maxChars) {
+                texts.push(text.slice(0, maxChars - chars));
+                chars = maxChars;
+            }
+            truncated = 'max_chars';
+            return;
+        }
+        seen.add(text);
+        texts.push(text);
+        chars += text.length;
+    }
+
+    function visit(element, visible) {
+        nodes++;
+        if (!visible) {
+            return;
+        }
+        let own = '';
+        for (const child of element.childNodes) {
+            if (child.nodeType === Node.TEXT_NODE) {
+                own += child.data;
+            }
+        }
+        add(own);
+        const tag = element.tagName;
+        if ((tag === 'INPUT' && element.type !== 'password') || tag === 'TEXTAREA' || tag === 'SELECT') {
+            add(element.value || '');
+        }
+    }
+
+    const root = document.body || document.documentElement;
+    if (!root) {
+        return {texts, truncated, nodes};
+    }
+    const hidden = new WeakSet();
+    const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT, {
+        acceptNode(element) {
+            if (skipTags.has(element.tagName.toUpperCase())) {
+                return NodeFilter.FILTER_REJECT;
+            }
+            const style = getComputedStyle(element);
+            if (style.display === 'none') {
+                return NodeFilter.FILTER_REJECT;
+            }
+            if (style.visibility === 'hidden') {
+                // Children may still be visible, so keep walking but drop this element's own text
+                hidden.add(element);
+            }
+            return NodeFilter.FILTER_ACCEPT;
+        }
+    });
+    visit(root, true);
+    while (!truncated && walker.nextNode()) {
+        if (nodes >= maxNodes) {
+            truncated = 'max_nodes';
+        } else if ((nodes & 255) === 0 && performance.now() - started > maxTimeMs) {
+            truncated = 'max_time_ms';
+        } else {
+            visit(walker.currentNode, !hidden.has(walker.currentNode));
+        }
+    }
+    return {texts, truncated, nodes};
+}'''
+
+class SnapshotToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        target = self._target(session_id, arguments)
+        options = {
+            "interactiveOnly": arguments.get("interactive_only", False),
+            "maxDepth": arguments.get("max_depth", 50),
+            "maxNodes": arguments.get("max_nodes", 5000),
+        }
+        result = await target.evaluate(SNAPSHOT_JS, options)
+        text = f"Snapshot of {target.url}:\n{result['tree']}"
+        if result["truncated"]:
+            text += f"\n(truncated after {options['maxNodes']} nodes)"
+        return [types.TextContent(type="text", text=text)]
+
+# Builds a compact accessibility tree: one line per node with role, name and
+# state. Interactive nodes get a short ref (e1, e2, ...) kept in a WeakMap so an
+# element keeps its ref across snapshots, and mirrored into a data-mcp-ref
+# attribute so tools can target it with a plain CSS selector.
+SNAPSHOT_JS = '''({interactiveOnly, maxDepth, maxNodes}) => {
+    const refs = window.__mcpRefs || (window.__mcpRefs = {map: new WeakMap(), next: 1});
+    const implicitRoles = {
+        A: el => el.hasAttribute('href') ? 'link' : null,
+        BUTTON: () => 'button', SELECT: () => 'combobox', TEXTAREA: () => 'textbox',
+        H1: () => 'heading', H2: () => 'heading', H3: () => 'heading',
+        H4: () => 'heading', H5: () => 'heading', H6: () => 'heading',
+        IMG: () => 'img', NAV: () => 'navigation', MAIN: () => 'main', FORM: () => 'form',
+        UL: () => 'list', OL: () => 'list', LI: () => 'listitem', TABLE: () => 'table',
+        TR: () => 'row', TD: () => 'cell', TH: () => 'columnheader', DIALOG: () => 'dialog',
+        OPTION: () => 'option', IFRAME: () => 'iframe', P: () => 'paragraph', LABEL: () => 'label',
+        INPUT: el => ({checkbox: 'checkbox', radio: 'radio', button: 'button', submit: 'button',
+                       reset: 'button', image: 'button', range: 'slider', hidden: null})[el.type] ?? 'textbox',
+    };
+    const interactiveRoles = new Set(['link', 'button', 'textbox', 'combobox', 'checkbox', 'radio',
+        'slider', 'option', 'menuitem', 'tab', 'switch', 'searchbox', 'listbox', 'treeitem']);
+    // Controls that cannot hold other controls, focusable containers and widgets like listboxes are still walked
+    const leafRoles = new Set(['link', 'button', 'textbox', 'checkbox', 'radio', 'slider', 'option',
+        'switch', 'searchbox', 'tab']);
+    const skipTags = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE', 'HEAD']);
+    const lines = [];
+    let count = 0;
+    let truncated = false;
+
+    function roleOf(el) {
+        const explicit = el.getAttribute('role');
+        if (explicit) {
+            return explicit.split(' ')[0];
+        }
+        if (el.isContentEditable && !el.parentElement?.isContentEditable) {
+            return 'textbox';
+        }
+        const implicit = implicitRoles[el.tagName];
+        return implicit ? implicit(el) : null;
+    }
+
+    function nameOf(el, role) {
+        const label = el.getAttribute('aria-label');
+        if (label) {
+            return label;
+        }
+        const labelledBy = el.getAttribute('aria-labelledby');
+        if (labelledBy) {
+            return labelledBy.split(' ').map(id => document.getElementById(id)?.textContent || '').join(' ');
+        }
+        if (el.labels && el.labels.length) {
+            return el.labels[0].textContent;
+        }
+        const attribute = el.getAttribute('alt') || el.getAttribute('title') || el.getAttribute('placeholder') || el.getAttribute('name');
+        if (attribute) {
+            return attribute;
+        }
+        if (role === 'textbox' || role === 'combobox' || role === 'list' || role === 'table' || role === 'form') {
+            return '';
+        }
+        return el.textContent;
+    }
+
+    function isInteractive(el, role) {
+        return interactiveRoles.has(role) || el.hasAttribute('onclick')
+            || (el.hasAttribute('tabindex') && el.tabIndex >= 0);
+    }
+
+    function refOf(el) {
+        let ref = refs.map.get(el);
+        if (!ref) {
+            ref = 'e' + refs.next++;
+            refs.map.set(el, ref);
+        }
+        el.setAttribute('data-mcp-ref', ref);
+        return ref;
+    }
+
+    function describe(el, role, interactive) {
+        let name = (nameOf(el, role) || '').replace(/\\s+/g, ' ').trim();
+        if (name.length > 80) {
+            name = name.slice(0, 77) + '...';
+        }
+        let line = `- ${role || 'generic'}`;
+        if (name) {
+            line += ` ${JSON.stringify(name)}`;
+        }
+        if (interactive) {
+            line += ` [ref=${refOf(el)}]`;
+        }
+        if (el.disabled || el.getAttribute('aria-disabled') === 'true') line += ' [disabled]';
+        if (el.checked || el.getAttribute('aria-checked') === 'true') line += ' [checked]';
+        if (el.getAttribute('aria-expanded')) line += ` [expanded=${el.getAttribute('aria-expanded')}]`;
+        if (el.getAttribute('aria-selected') === 'true' || (el.tagName === 'OPTION' && el.selected)) line += ' [selected]';
+        if ((role === 'textbox' || role === 'combobox') && el.value) line += ` [value=${JSON.stringify(el.value.slice(0, 80))}]`;
+        if (role === 'heading' && /^H[1-6]$/.test(el.tagName)) line += ` [level=${el.tagName[1]}]`;
+        return line;
+    }
+
+    function walk(el, depth) {
+        if (truncated || skipTags.has(el.tagName) || el.getAttribute('aria-hidden') === 'true') {
+            return;
+        }
+        const style = getComputedStyle(el);
+        if (style.display === 'none') {
+            return;
+        }
+        const role = roleOf(el);
+        const interactive = isInteractive(el, role);
+        const shown = style.visibility !== 'hidden' && role !== 'presentation' && role !== 'none'
+            && (interactive || (!interactiveOnly && role));
+        if (shown) {
+            if (++count > maxNodes) {
+                truncated = true;
+                return;
+            }
+            lines.push('  '.repeat(depth) + describe(el, role, interactive));
+            if (leafRoles.has(role)) {
+                // The name already summarises a control's content
+                return;
+            }
+        }
+        if (depth >= maxDepth) {
+            return;
+        }
+        for (const child of el.children) {
+            walk(child, shown ? depth + 1 : depth);
+        }
+    }
+
+    walk(document.body || document.documentElement, 0);
+    return {tree: lines.join('\\n'), truncated};
+}'''
+
+# Builds a CSS selector for a snapshot ref that still works once the ref attribute is gone
+CSS_PATH_JS = '''(ref) => {
+    let el = document.querySelector(`[data-mcp-ref="${ref}"]`);
+    if (!el) {
+        return null;
+    }
+    const parts = [];
+    while (el && el.nodeType === Node.ELEMENT_NODE && el !== document.documentElement) {
+        if (el.id) {
+            parts.unshift('#' + CSS.escape(el.id));
+            break;
+        }
+        let index = 1;
+        for (let sibling = el.previousElementSibling; sibling; sibling = sibling.previousElementSibling) {
+            if (sibling.tagName === el.tagName) {
+                index++;
+            }
+        }
+        parts.unshift(`${el.tagName.toLowerCase()}:nth-of-type(${index})`);
+        el = el.parentElement;
+    }
+    return parts.join(' > ');
+}'''
+
+HTML_PAGE_SIZE = 50000
+# Sanitized documents are kept for cursor paging and html:// resource reads, up to the limit per connection
+HTML_DOCUMENTS_LIMIT = 16
+html_documents: OrderedDict[str, dict] = OrderedDict()
+
+def _store_html_document(selector: str, url: str, html: str) -> str:
+    document_id = uuid.uuid4().hex[:12]
+    owner = _owner()
+    html_documents[document_id] = {"selector": selector, "url": url, "html": html, "owner": owner}
+    owned = [key for key, document in html_documents.items() if document["owner"] == owner]
+    for expired in owned[:-HTML_DOCUMENTS_LIMIT]:
+        del html_documents[expired]
+    return document_id
+
+class GetHtmlContentToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        page_size = arguments.get("page_size", HTML_PAGE_SIZE)
+        cursor = arguments.get("cursor")
+        if cursor:
+            # Later pages come from the stored document, the browser is not touched again
+            document_id, _, offset = cursor.partition(":")
+            document = html_documents.get(document_id)
+            if document is None or document["owner"] != _owner():
+                return [types.TextContent(type="text", text=f"Error: cursor {cursor} has expired, fetch the content again")]
+            html_documents.move_to_end(document_id)
+            return self._page(document_id, document["selector"], document["html"], int(offset or 0), page_size)
+
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        target = self._target(session_id, arguments)
+        selector = arguments.get("selector") or "body"
+        options = {
+            "strip": arguments.get("strip", ["script", "style", "svg", "comments"]),
+            "collapseWhitespace": arguments.get("collapse_whitespace", True),
+            "maxDepth": arguments.get("max_depth"),
+        }
+        # Sanitizing runs in the page so only the reduced markup crosses the wire
+        with tool_metrics.phase("evaluate"):
+            html_content = await target.locator(selector).first.evaluate(SANITIZE_HTML_JS, options)
+        if len(html_content) <= page_size:
+            return [types.TextContent(type="text", text=f"HTML content of element with selector {selector}: {html_content}")]
+        document_id = _store_html_document(selector, target.url, html_content)
+        return self._page(document_id, selector, html_content, 0, page_size)
+
+    def _page(self, document_id: str, selector: str, html: str, offset: int, page_size: int) -> list[types.TextContent]:
+        end = min(offset + page_size, len(html))
+        text = f"HTML content of element with selector {selector} (characters {offset}-{end} of {len(html)}, full content at html://{document_id}): {html[offset:end]}"
+        if end < len(html):
+            text += f"\nnext_cursor: {document_id}:{end}"
+        return [types.TextContent(type="text", text=text)]
+
+# Serializes an element's children in one pass, leaving out stripped tags and
+# comments, collapsing whitespace and eliding anything deeper than maxDepth.
+SANITIZE_HTML_JS = '''(root, {strip, collapseWhitespace, maxDepth}) => {
+    const stripped = new Set(strip.filter(s => s !== 'comments').map(s => s.toUpperCase()));
+    const keepComments = !strip.includes('comments');
+    const voidTags = new Set(['AREA', 'BASE', 'BR', 'COL', 'EMBED', 'HR', 'IMG', 'INPUT', 'LINK', 'META', 'SOURCE', 'TRACK', 'WBR']);
+    // Script and style text is not markup and goes out as is, pre and textarea text
+    // keeps its whitespace but is escaped like any other text
+    const rawTextTags = new Set(['SCRIPT', 'STYLE']);
+    const preformattedTags = new Set(['PRE', 'TEXTAREA']);
+    const escapeText = text => text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+    const escapeAttribute = value => value.replace(/&/g, '&amp;').replace(/"/g, '&quot;');
+    const out = [];
+
+    function serializeChildren(node, depth, raw, preformatted) {
+        for (const child of node.childNodes) {
+            serialize(child, depth, raw, preformatted);
+        }
+    }
+
+    function serialize(node, depth, raw, preformatted) {
+        if (node.nodeType === Node.TEXT_NODE) {
+            let text = raw ? node.data : escapeText(node.data);
+            if (collapseWhitespace && !raw && !preformatted) {
+                text = text.replace(/\\s+/g, ' ');
+                if (text === ' ') {
+                    return;
+                }
+            }
+            out.push(text);
+        } else if (node.nodeType === Node.COMMENT_NODE) {
+            if (keepComments) {
+                out.push(`<!--${node.data}-->`);
+            }
+        } else if (node.nodeType === Node.ELEMENT_NODE) {
+            const tag = node.tagName.toUpperCase();
+            if (stripped.has(tag)) {
+                return;
+            }
+            const name = node.tagName.toLowerCase();
+            let open = '<' + name;
+            for (const attribute of node.attributes) {
+                open += ` ${attribute.name}="${escapeAttribute(attribute.value)}"`;
+            }
+            out.push(open + '>');
+            if (voidTags.has(tag)) {
+                return;
+            }
+            if (maxDepth != null && depth >= maxDepth) {
+                if (node.childNodes.length) {
+                    out.push('...');
+                }
+            } else {
+                serializeChildren(node.content || node, depth + 1, rawTextTags.has(tag), preformatted || preformattedTags.has(tag));
+            }
+            out.push(`</${name}>`);
+        }
+    }
+
+    serializeChildren(root, 0, false, false);
+    return out.join('');
+}'''
+
+
+class ListPagesToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        context = self._sessions[session_id]["page"].context
+        pages = context.pages
+        
+        # Titles are fetched for all tabs at once instead of one round trip after another
+        titles = await asyncio.gather(*(page.title() for page in pages), return_exceptions=True)
+        page_info = []
+        for i, (page, title) in enumerate(zip(pages, titles)):
+            if isinstance(title, Exception):
+                title = f"<unavailable: {title}>"
+            page_info.append(f"Page {i}: URL={page.url}, Title={title}")
+        
+        return [types.TextContent(type="text", text=f"Available pages: {page_info}")]
+
+class FanOutToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        pages = self._sessions[session_id]["page"].context.pages
+        operation = arguments.get("operation")
+        if operation not in ("evaluate", "text", "screenshot"):
+            return [types.TextContent(type="text", text=f"Error: unknown operation {operation}")]
+
+        results = await asyncio.gather(*(self._run(page, operation, arguments) for page in pages), return_exceptions=True)
+        summary = {}
+        images = []
+        for i, (page, result) in enumerate(zip(pages, results)):
+            entry = {"url": page.url}
+            if isinstance(result, Exception):
+                entry["error"] = str(result)
+            elif operation == "screenshot":
+                images.append(types.TextContent(type="text", text=f"Page {i}: {page.url}"))
+                images.append(result)
+            else:
+                entry["result"] = result
+            summary[str(i)] = entry
+        return [types.TextContent(type="text", text=json.dumps(summary, default=str))] + images
+
+    async def _run(self, page, operation: str, arguments: dict):
+        if operation == "evaluate":
+            return await page.evaluate(arguments.get("script"))
+        if operation == "text":
+            limits = {"maxNodes": 20000, "maxChars": arguments.get("max_chars", 2000), "maxTimeMs": 1000}
+            return (await page.evaluate(TEXT_EXTRACT_JS, limits))["texts"]
+        image_format = arguments.get("format", "jpeg")
+        data = await page.screenshot(type=image_format, quality=arguments.get("quality", 60) if image_format == "jpeg" else None)
+        return types.ImageContent(type="image", data=base64.b64encode(data).decode("utf-8"), mimeType=IMAGE_MIME_TYPES[image_format])
 
 class SwitchToPageToolHandler(ToolHandler):
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
         context = self._sessions[session_id]["page"].context
         pages = context.pages
         
@@ -441,42 +1985,65 @@ class SwitchToPageToolHandler(ToolHandler):
 
 class FrameToolHandler(ToolHandler):
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
         page = self._sessions[session_id]["page"]
         
         frame_name = arguments.get("name")
         selector = arguments.get("selector")
+        path = arguments.get("path")
         
         try:
-            if frame_name:
+            if path:
+                frame = _resolve_frame_path(self._sessions[session_id], path)
+                if not frame:
+                    return [types.TextContent(type="text", text=f"Frame with path '{path}' not found")]
+                self._sessions[session_id]["frame"] = frame
+                return [types.TextContent(type="text", text=f"Switched to frame with path '{path}'")]
+            elif frame_name:
                 frame = page.frame(name=frame_name)
                 if not frame:
                     return [types.TextContent(type="text", text=f"Frame with name '{frame_name}' not found")]
                 self._sessions[session_id]["frame"] = frame
                 return [types.TextContent(type="text", text=f"Switched to frame with name '{frame_name}'")]
             elif selector:
-                frame_element = page.locator(selector).first
+                # The selector is looked up in the current frame so nested iframes can be entered step by step
+                frame_element = await self._target(session_id, {}).locator(selector).first.element_handle(timeout=5000)
                 if not frame_element:
                     return [types.TextContent(type="text", text=f"Frame with selector '{selector}' not found")]
-                frame = frame_element.content_frame()
+                frame = await frame_element.content_frame()
                 if not frame:
                     return [types.TextContent(type="text", text=f"Could not access content frame for selector '{selector}'")]
                 self._sessions[session_id]["frame"] = frame
                 return [types.TextContent(type="text", text=f"Switched to frame with selector '{selector}'")]
             else:
                 # Reset to main frame
-                self._sessions[session_id]["frame"] = page.main_frame
+                self._sessions[session_id].pop("frame", None)
                 return [types.TextContent(type="text", text="Reset to main frame")]
         except Exception as e:
             return [types.TextContent(type="text", text=f"Error switching to frame: {str(e)}")]
 
+class ListFramesToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        active = self._target(session_id, {})
+        lines = []
+        for entry in _frame_tree(self._sessions[session_id]):
+            frame = entry["frame"]
+            line = "  " * entry["depth"] + f"- {entry['path'] or '(main)'}: name={frame.name!r} url={frame.url}"
+            if frame is active:
+                line += " [active]"
+            lines.append(line)
+        return [types.TextContent(type="text", text="Frames:\n" + "\n".join(lines))]
+
 class WaitForTimeoutToolHandler(ToolHandler):
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
         page = self._sessions[session_id]["page"]
         
         timeout = arguments.get("timeout", 1000)  # Default to 1 second if not specified
@@ -484,47 +2051,904 @@ class WaitForTimeoutToolHandler(ToolHandler):
         
         return [types.TextContent(type="text", text=f"Waited for {timeout} milliseconds")]
 
+class WaitForToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        page = self._sessions[session_id]["page"]
+        # Selector and DOM conditions run in the target frame, URL and load conditions on the page
+        target = self._target(session_id, arguments)
+
+        condition = arguments.get("condition")
+        timeout = arguments.get("timeout", 30000)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            detail = await asyncio.wait_for(
+                self._wait(condition, page, target, arguments, timeout), timeout / 1000
+            )
+        except (asyncio.TimeoutError, PlaywrightTimeoutError):
+            waited = round((loop.time() - started) * 1000)
+            return [types.TextContent(type="text", text=f"Timed out after {waited} ms waiting for {condition}")]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Error waiting for {condition}: {str(e)}")]
+        waited = round((loop.time() - started) * 1000)
+        message = f"Condition {condition} met after {waited} ms"
+        if detail:
+            message += f": {detail}"
+        return [types.TextContent(type="text", text=message)]
+
+    async def _wait(self, condition, page, target, arguments, timeout) -> str | None:
+        selector = arguments.get("selector")
+        quiet_ms = arguments.get("quiet_ms", 500)
+        if condition in ("selector_visible", "selector_hidden"):
+            state = "visible" if condition == "selector_visible" else "hidden"
+            await target.locator(selector).first.wait_for(state=state, timeout=timeout)
+        elif condition == "url":
+            url = arguments.get("url")
+            await page.wait_for_url(re.compile(url) if arguments.get("regex") else url, wait_until="commit", timeout=timeout)
+            return page.url
+        elif condition == "load_state":
+            await page.wait_for_load_state(arguments.get("state", "load"), timeout=timeout)
+        elif condition == "network_idle":
+            await self._wait_network_quiet(page, quiet_ms)
+        elif condition == "dom_quiet":
+            await target.evaluate(DOM_QUIET_JS, quiet_ms)
+        elif condition == "text":
+            return await self._wait_text(page, arguments.get("text"))
+        elif condition == "download":
+            download = await page.wait_for_event("download", timeout=timeout)
+            return download.suggested_filename
+        else:
+            raise ValueError(f"Unknown condition: {condition}")
+        return None
+
+    async def _wait_network_quiet(self, page, quiet_ms: int):
+        """
+        Resolve once no request has been in flight for quiet_ms. Playwright cannot list
+        requests already running, so only those started after the listeners are attached count.
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = set()
+        last_activity = loop.time()
+
+        def on_request(request):
+            nonlocal last_activity
+            in_flight.add(request)
+            last_activity = loop.time()
+
+        def on_done(request):
+            nonlocal last_activity
+            in_flight.discard(request)
+            last_activity = loop.time()
+
+        page.on("request", on_request)
+        page.on("requestfinished", on_done)
+        page.on("requestfailed", on_done)
+        try:
+            while True:
+                remaining = last_activity + quiet_ms / 1000 - loop.time()
+                if not in_flight and remaining <= 0:
+                    return
+                await asyncio.sleep(max(remaining, 0.05))
+        finally:
+            page.remove_listener("request", on_request)
+            page.remove_listener("requestfinished", on_done)
+            page.remove_listener("requestfailed", on_done)
+
+    async def _wait_text(self, page, text: str) -> str:
+        """Poll every frame of the page, including ones attached while waiting, for the text."""
+        while True:
+            for frame in page.frames:
+                try:
+                    if await frame.evaluate(TEXT_PRESENT_JS, text):
+                        return frame.name or frame.url
+                except Exception:
+                    # Frames can detach or navigate between listing and evaluating
+                    pass
+            await asyncio.sleep(0.1)
+
+# Resolves once the document has gone quiet_ms without a DOM mutation
+DOM_QUIET_JS = '''(quietMs) => new Promise(resolve => {
+    let timer = setTimeout(done, quietMs);
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(done, quietMs);
+    });
+    function done() {
+        observer.disconnect();
+        resolve(true);
+    }
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+})'''
+
+TEXT_PRESENT_JS = '''(text) => !!document.body && document.body.textContent.includes(text)'''
+
+DOWNLOADS_DIR = os.environ.get("PLAYWRIGHT_DOWNLOADS_DIR", "downloads")
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+class DownloadManager:
+    """
+    Tracks every download started in a session's context, any number at a time.
+    Finished files are streamed into DOWNLOADS_DIR named by their SHA-256, so the
+    same file downloaded twice is stored once and every result can be verified.
+    Playwright only hands over a file once it is complete, so bytes counts what has
+    been stored and is 0 while the transfer itself is still running.
+    """
+
+    def __init__(self, context):
+        self._context = context
+        self._downloads: dict[str, dict] = {}
+        self._ids: dict = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._started = asyncio.Event()
+        for page in context.pages:
+            self.watch(page)
+        context.on("page", self.watch)
+
+    def watch(self, page):
+        page.on("download", self.track)
+
+    def track(self, download) -> str:
+        """Start tracking a click-triggered download, returns its id (the same id if already tracked)."""
+        if download in self._ids:
+            return self._ids[download]
+        record = self._new_record(download.url, download.suggested_filename)
+        self._ids[download] = record["id"]
+        self._run(record, self._save_download(record, download))
+        return record["id"]
+
+    def fetch(self, url: str) -> str:
+        """Fetch a URL through the context's request API, sharing its cookies, without any click."""
+        record = self._new_record(url, os.path.basename(url.split("?")[0]) or "download")
+        self._run(record, self._fetch(record, url))
+        return record["id"]
+
+    def _new_record(self, url: str, filename: str) -> dict:
+        record = {
+            "id": uuid.uuid4().hex[:8], "url": url, "filename": filename, "state": "in_progress",
+            "bytes": 0, "sha256": None, "path": None, "error": None,
+            "started": asyncio.get_running_loop().time(), "ms": None,
+        }
+        self._downloads[record["id"]] = record
+        return record
+
+    def _run(self, record: dict, coroutine):
+        self._tasks[record["id"]] = asyncio.create_task(self._finish(record, coroutine))
+        self._started.set()
+
+    async def _finish(self, record: dict, coroutine):
+        try:
+            await coroutine
+            record["state"] = "completed"
+        except Exception as e:
+            record["state"] = "failed"
+            record["error"] = str(e)
+        record["ms"] = round((asyncio.get_running_loop().time() - record["started"]) * 1000, 1)
+
+    async def _save_download(self, record: dict, download):
+        source = await download.path()
+        failure = await download.failure()
+        if failure:
+            raise RuntimeError(failure)
+
+        def chunks():
+            with open(source, "rb") as source_file:
+                while chunk := source_file.read(DOWNLOAD_CHUNK_SIZE):
+                    yield chunk
+
+        await asyncio.to_thread(self._store, record, chunks())
+
+    async def _fetch(self, record: dict, url: str):
+        # The request API hands back the whole body, so only the hashing and writing are streamed
+        response = await self._context.request.get(url)
+        try:
+            if not response.ok:
+                raise RuntimeError(f"HTTP {response.status} fetching {url}")
+            body = await response.body()
+        finally:
+            await response.dispose()
+        chunks = (body[i:i + DOWNLOAD_CHUNK_SIZE] for i in range(0, len(body), DOWNLOAD_CHUNK_SIZE))
+        await asyncio.to_thread(self._store, record, chunks)
+
+    def _store(self, record: dict, chunks):
+        os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+        digest = hashlib.sha256()
+        partial = os.path.join(DOWNLOADS_DIR, f".{record['id']}.part")
+        with open(partial, "wb") as target_file:
+            for chunk in chunks:
+                digest.update(chunk)
+                target_file.write(chunk)
+                record["bytes"] += len(chunk)
+        sha256 = digest.hexdigest()
+        path = os.path.join(DOWNLOADS_DIR, sha256 + os.path.splitext(record["filename"])[1])
+        os.replace(partial, path)
+        record["sha256"] = sha256
+        record["path"] = path
+
+    async def wait(self, download_id: str | None = None, timeout: float = 30000) -> dict:
+        """Wait for a download to finish. Without an id waits for the latest one, or the next to start."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout / 1000
+        if download_id is None:
+            if self._downloads:
+                download_id = list(self._downloads.keys())[-1]
+            else:
+                self._started.clear()
+                await asyncio.wait_for(self._started.wait(), timeout / 1000)
+                download_id = next(iter(self._downloads))
+        if download_id not in self._downloads:
+            raise ValueError(f"Unknown download: {download_id}")
+        await asyncio.wait_for(asyncio.shield(self._tasks[download_id]), max(deadline - loop.time(), 0))
+        return self._downloads[download_id]
+
+    def records(self) -> list[dict]:
+        return list(self._downloads.values())
+
+def _describe_download(record: dict) -> str:
+    fields = {k: record[k] for k in ("id", "state", "filename", "bytes", "sha256", "path", "ms", "error", "url")}
+    return json.dumps(fields)
+
+async def _copy_download(record: dict, save_path: str | None) -> dict:
+    if save_path and record["state"] == "completed":
+        await asyncio.to_thread(shutil.copyfile, record["path"], save_path)
+    return record
+
 class DownloadFileToolHandler(ToolHandler):
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        
-        session_id = list(self._sessions.keys())[-1]
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
         page = self._sessions[session_id]["page"]
+        manager = self._sessions[session_id]["downloads"]
         selector = arguments.get("selector")
-        save_path = arguments.get("save_path", "./downloaded_file")
+        save_path = arguments.get("save_path")
         
         try:
             # Create a wait_for_download future
             async with page.expect_download() as download_info:
                 # Click the download link
-                await page.locator(selector).click()
-            
-            # Wait for the download to complete
-            download = await download_info.value
-            
-            # Save the downloaded file
-            await download.save_as(save_path)
-            
-            return [types.TextContent(type="text", text=f"File downloaded successfully and saved to {save_path}")]
+                await self._target(session_id, arguments).locator(selector).click()
+            download_id = manager.track(await download_info.value)
+            if not arguments.get("wait", True):
+                return [types.TextContent(type="text", text=f"Download started: {download_id}")]
+
+            record = await _copy_download(await manager.wait(download_id, arguments.get("timeout", 60000)), save_path)
+            if record["state"] != "completed":
+                return [types.TextContent(type="text", text=f"Error downloading file: {_describe_download(record)}")]
+            saved = f" and saved to {save_path}" if save_path else ""
+            return [types.TextContent(type="text", text=f"File downloaded successfully{saved}: {_describe_download(record)}")]
         except Exception as e:
             return [types.TextContent(type="text", text=f"Error downloading file: {str(e)}")]
 
+class FetchUrlToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        manager = self._sessions[session_id]["downloads"]
+        download_id = manager.fetch(arguments.get("url"))
+        if not arguments.get("wait", True):
+            return [types.TextContent(type="text", text=f"Download started: {download_id}")]
+        try:
+            record = await _copy_download(await manager.wait(download_id, arguments.get("timeout", 60000)), arguments.get("save_path"))
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Error fetching file: {str(e)}")]
+        if record["state"] != "completed":
+            return [types.TextContent(type="text", text=f"Error fetching file: {_describe_download(record)}")]
+        return [types.TextContent(type="text", text=f"File fetched successfully: {_describe_download(record)}")]
+
+class WaitForDownloadToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        manager = self._sessions[session_id]["downloads"]
+        try:
+            record = await manager.wait(arguments.get("download_id"), arguments.get("timeout", 30000))
+            record = await _copy_download(record, arguments.get("save_path"))
+        except asyncio.TimeoutError:
+            return [types.TextContent(type="text", text=f"Timed out waiting for download {arguments.get('download_id') or ''}".rstrip())]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Error waiting for download: {str(e)}")]
+        if record["state"] != "completed":
+            return [types.TextContent(type="text", text=f"Error downloading file: {_describe_download(record)}")]
+        return [types.TextContent(type="text", text=f"Download finished: {_describe_download(record)}")]
+
+class ListDownloadsToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        downloads = [_describe_download(record) for record in self._sessions[session_id]["downloads"].records()]
+        return [types.TextContent(type="text", text="Downloads:\n" + "\n".join(downloads))]
+
+# Handlers report most failures as text rather than raising, these prefixes mark them
+ERROR_PREFIXES = ("Error", "No active session", "Unknown session", "Timed out", "Invalid", "Frame with", "Could not")
+
+def _is_error_result(result: list) -> bool:
+    return any(isinstance(item, types.TextContent) and item.text.startswith(ERROR_PREFIXES) for item in result)
+
+def _result_text(result: list) -> str:
+    return "\n".join(item.text for item in result if isinstance(item, types.TextContent))
+
+# Tools whose output is a JSON value, substituted bare: strings without quotes, anything else as JSON
+JSON_OUTPUT_TOOLS = {"playwright_evaluate": "Evaluated script, result: ", "playwright_call_script": ""}
+
+def _step_output(tool: str, result: list) -> str:
+    """Value a named step contributes to ${name}, without the tool's message around it."""
+    text = _result_text(result)
+    prefix = JSON_OUTPUT_TOOLS.get(tool)
+    if prefix is None or not text.startswith(prefix):
+        return text
+    try:
+        value = json.loads(text[len(prefix):])
+    except ValueError:
+        return text[len(prefix):]
+    return value if isinstance(value, str) else json.dumps(value)
+
+def _substitute_outputs(value, outputs: dict[str, str]):
+    """Replace ${name} references in string arguments with earlier named step outputs."""
+    if isinstance(value, str):
+        return re.sub(r"\$\{(\w+)\}", lambda m: outputs.get(m.group(1), m.group(0)), value)
+    if isinstance(value, dict):
+        return {k: _substitute_outputs(v, outputs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute_outputs(v, outputs) for v in value]
+    return value
+
+class BatchToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        steps = arguments.get("steps", [])
+        stop_on_error = arguments.get("on_error", "stop") == "stop"
+        session_id = arguments.get("session_id")
+        loop = asyncio.get_running_loop()
+        outputs: dict[str, str] = {}
+        report = []
+        extra_content = []
+        ok = True
+
+        for index, step in enumerate(steps):
+            tool = step.get("tool")
+            step_arguments = _substitute_outputs(step.get("arguments", {}), outputs)
+            if session_id and "session_id" not in step_arguments:
+                step_arguments["session_id"] = session_id
+            entry = {"index": index, "tool": tool}
+            started = loop.time()
+            try:
+                if tool not in tool_handlers or tool == name:
+                    raise ValueError(f"Unknown tool: {tool}")
+                # Steps bypass _call_tool, so a popup from an earlier step's click is picked up here
+                await _adopt_late_popup(self._sessions.get(self._session_id(step_arguments)))
+                result = await tool_handlers[tool].handle(tool, step_arguments)
+                text = _result_text(result)
+                entry["status"] = "error" if _is_error_result(result) else "ok"
+                entry["output"] = text
+                extra_content.extend(item for item in result if not isinstance(item, types.TextContent))
+                if step.get("name"):
+                    outputs[step["name"]] = _step_output(tool, result)
+            except Exception as e:
+                entry["status"] = "error"
+                entry["output"] = f"Error: {str(e)}"
+            entry["ms"] = round((loop.time() - started) * 1000, 1)
+            report.append(entry)
+            if entry["status"] == "error":
+                ok = False
+                if stop_on_error:
+                    break
+
+        summary = {"ok": ok, "completed": len(report), "total": len(steps), "steps": report}
+        return [types.TextContent(type="text", text=json.dumps(summary))] + extra_content
+
+# Tools that manage recordings or sessions are never written into a recording
+UNRECORDED_TOOLS = {
+    "playwright_new_session", "playwright_close_session",
+    "playwright_record_start", "playwright_record_stop", "playwright_replay",
+    "playwright_trace_start", "playwright_trace_save", "playwright_trace_stop",
+}
+# Recorded sleeps are dropped on replay, the condition waits below replace them
+REPLAY_SKIPPED_TOOLS = {"playwright_wait_for_timeout"}
+# Tools whose target element is waited for before the step is replayed
+REPLAY_READY_TOOLS = {"playwright_click", "playwright_fill", "playwright_download_file"}
+RECORDINGS_DIR = os.environ.get("PLAYWRIGHT_RECORDINGS_DIR", "recordings")
+
+def _record_step(session: dict, name: str, arguments: dict, result: list, elapsed_ms: float):
+    recording = session.get("recording")
+    if recording is None or name in UNRECORDED_TOOLS or _is_error_result(result):
+        return
+    step_arguments = {k: v for k, v in arguments.items() if k != "session_id"}
+    if name == "playwright_click_text":
+        # Store the selector the text resolved to so replay does not depend on the tool's lookup rules
+        step_arguments = {"selector": f"text={arguments.get('text')} >> nth=0", **{k: v for k, v in step_arguments.items() if k != "text"}}
+        name = "playwright_click"
+    recording["steps"].append({
+        "tool": name,
+        "arguments": step_arguments,
+        "url": session["page"].url,
+        "ms": round(elapsed_ms, 1),
+    })
+
+class RecordStartToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        self._sessions[session_id]["recording"] = {"steps": []}
+        return [types.TextContent(type="text", text=f"Recording tool calls for session {session_id}")]
+
+class RecordStopToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        recording = self._sessions[session_id].pop("recording", None)
+        if recording is None:
+            return [types.TextContent(type="text", text=f"Error: session {session_id} is not recording")]
+        path = arguments.get("path") or os.path.join(RECORDINGS_DIR, f"{session_id}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as replay_file:
+            json.dump({"version": 1, "steps": recording["steps"]}, replay_file, indent=2)
+        return [types.TextContent(type="text", text=f"Saved {len(recording['steps'])} steps to {path}")]
+
+class ReplayToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        with open(arguments.get("path")) as replay_file:
+            steps = json.load(replay_file)["steps"]
+        step_timeout = arguments.get("step_timeout", 10000)
+        loop = asyncio.get_running_loop()
+        report = []
+
+        for index, step in enumerate(steps):
+            tool = step["tool"]
+            if tool in REPLAY_SKIPPED_TOOLS:
+                continue
+            step_arguments = {**step.get("arguments", {}), "session_id": session_id}
+            entry = {"index": index, "tool": tool}
+            started = loop.time()
+            try:
+                await _adopt_late_popup(self._sessions.get(session_id))
+                if tool in REPLAY_READY_TOOLS and step_arguments.get("selector"):
+                    # Wait in the frame the step will run in
+                    ready = await WaitForToolHandler().handle("playwright_wait_for", {
+                        "session_id": session_id, "condition": "selector_visible",
+                        "selector": step_arguments["selector"], "timeout": step_timeout,
+                        "frame": step_arguments.get("frame"),
+                    })
+                    if _is_error_result(ready):
+                        raise RuntimeError(_result_text(ready))
+                result = await tool_handlers[tool].handle(tool, step_arguments)
+                if _is_error_result(result):
+                    raise RuntimeError(_result_text(result))
+                entry["status"] = "ok"
+            except Exception as e:
+                entry["status"] = "error"
+                entry["output"] = str(e)
+            entry["ms"] = round((loop.time() - started) * 1000, 1)
+            report.append(entry)
+            if entry["status"] == "error":
+                # Hand control back to the caller with everything it needs to carry on by hand
+                summary = {"ok": False, "failed_at": index, "steps": report, "remaining": steps[index:]}
+                return [types.TextContent(type="text", text=json.dumps(summary))]
+
+        summary = {"ok": True, "steps": report}
+        return [types.TextContent(type="text", text=json.dumps(summary))]
+
+# Saved traces form a ring buffer on disk, the oldest are deleted past either limit
+TRACES_DIR = os.environ.get("PLAYWRIGHT_TRACES_DIR", "traces")
+TRACE_BUFFER_SIZE = int(os.environ.get("PLAYWRIGHT_TRACE_BUFFER_SIZE", "20"))
+TRACE_BUFFER_BYTES = int(os.environ.get("PLAYWRIGHT_TRACE_BUFFER_MB", "500")) * 1024 * 1024
+
+class TraceStore:
+    """Bounded on-disk ring buffer of saved trace zips, served as trace://<id> resources."""
+
+    def __init__(self):
+        self.traces: OrderedDict[str, dict] = OrderedDict()
+
+    def reserve(self) -> str:
+        """Path for a chunk being written, it enters the buffer once added."""
+        os.makedirs(TRACES_DIR, exist_ok=True)
+        return os.path.join(TRACES_DIR, f".{uuid.uuid4().hex}.zip")
+
+    def add(self, path: str, session_id: str, started: float, ended: float, reason: str, owner: str | None = None) -> dict:
+        trace_id = uuid.uuid4().hex[:12]
+        final_path = os.path.join(TRACES_DIR, f"{trace_id}.zip")
+        os.replace(path, final_path)
+        record = {
+            "id": trace_id, "path": final_path, "session_id": session_id, "owner": owner, "reason": reason,
+            "started": started, "ended": ended, "seconds": round(ended - started, 1),
+            "bytes": os.path.getsize(final_path),
+        }
+        self.traces[trace_id] = record
+        while len(self.traces) > TRACE_BUFFER_SIZE or (
+            len(self.traces) > 1 and sum(trace["bytes"] for trace in self.traces.values()) > TRACE_BUFFER_BYTES
+        ):
+            _, oldest = self.traces.popitem(last=False)
+            with contextlib.suppress(OSError):
+                os.remove(oldest["path"])
+        return record
+
+    def get(self, trace_id: str) -> dict | None:
+        return self.traces.get(trace_id)
+
+    def records(self) -> list[dict]:
+        return list(self.traces.values())
+
+trace_store = TraceStore()
+
+class SessionTracer:
+    """
+    Playwright tracing of one session's context, written in chunks. Without a window
+    a single chunk runs from start to save or stop. With a window the chunk is
+    rotated every window seconds and only the previous chunk is kept, so a save
+    returns the previous and the current chunk, covering at least the last window.
+    """
+
+    def __init__(self, context, session_id: str, window: float | None):
+        self.context = context
+        self.session_id = session_id
+        # Saves can run outside the connection that started tracing, e.g. when it closes
+        self.owner = _owner()
+        self.window = window
+        self._lock = asyncio.Lock()
+        self._chunk_started = time.time()
+        self._previous: tuple[str, float, float] | None = None
+        self._rotator: asyncio.Task | None = None
+
+    async def start(self, arguments: dict):
+        await self.context.tracing.start(
+            title=f"session {self.session_id}",
+            screenshots=arguments.get("screenshots", True),
+            snapshots=arguments.get("snapshots", True),
+            sources=arguments.get("sources", True),
+        )
+        self._chunk_started = time.time()
+        if self.window:
+            self._rotator = asyncio.create_task(self._rotate())
+
+    async def _flush(self) -> tuple[str, float, float]:
+        path = trace_store.reserve()
+        await self.context.tracing.stop_chunk(path=path)
+        chunk = (path, self._chunk_started, time.time())
+        self._chunk_started = chunk[2]
+        return chunk
+
+    async def _rotate(self):
+        while True:
+            await asyncio.sleep(self.window)
+            async with self._lock:
+                chunk = await self._flush()
+                await self.context.tracing.start_chunk()
+                self._discard_previous()
+                self._previous = chunk
+
+    def _discard_previous(self):
+        if self._previous is not None:
+            with contextlib.suppress(OSError):
+                os.remove(self._previous[0])
+            self._previous = None
+
+    async def save(self, reason: str, stop: bool = False) -> list[dict]:
+        async with self._lock:
+            chunks = [self._previous] if self._previous else []
+            self._previous = None
+            chunks.append(await self._flush())
+            if stop:
+                self.cancel()
+                await self.context.tracing.stop()
+            else:
+                await self.context.tracing.start_chunk()
+        return [trace_store.add(path, self.session_id, started, ended, reason, self.owner) for path, started, ended in chunks]
+
+    def cancel(self):
+        if self._rotator is not None:
+            self._rotator.cancel()
+            self._rotator = None
+        self._discard_previous()
+
+def _describe_traces(traces: list[dict]) -> str:
+    return "\n".join(
+        f"Saved trace://{trace['id']} ({trace['seconds']}s, {trace['bytes']} bytes), view with: playwright show-trace {trace['path']}"
+        for trace in traces
+    )
+
+class TraceStartToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        session = self._sessions[session_id]
+        if session.get("tracer") is not None:
+            return [types.TextContent(type="text", text=f"Error: session {session_id} is already tracing")]
+        window = arguments.get("window_seconds")
+        tracer = SessionTracer(session["context"], session_id, window)
+        await tracer.start(arguments)
+        session["tracer"] = tracer
+        mode = f"keeping the last {window}s" if window else "until playwright_trace_stop"
+        return [types.TextContent(type="text", text=f"Tracing session {session_id}, {mode}")]
+
+class TraceSaveToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        tracer = self._sessions[session_id].get("tracer")
+        if tracer is None:
+            return [types.TextContent(type="text", text=f"Error: session {session_id} is not tracing")]
+        traces = await tracer.save("saved")
+        return [types.TextContent(type="text", text=_describe_traces(traces))]
+
+class TraceStopToolHandler(ToolHandler):
+    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        session_id = self._session_id(arguments)
+        if session_id is None:
+            return self._no_session(arguments)
+        tracer = self._sessions[session_id].get("tracer")
+        if tracer is None:
+            return [types.TextContent(type="text", text=f"Error: session {session_id} is not tracing")]
+        traces = await tracer.save("stopped", stop=True)
+        # Only forget the tracer once stopped, a failed stop can be retried or cancelled on close
+        self._sessions[session_id].pop("tracer", None)
+        return [types.TextContent(type="text", text=_describe_traces(traces))]
+
+class PageLanes:
+    """
+    One FIFO execution lane per page. Calls on the same page run one at a time in
+    arrival order, calls on different pages and sessions run concurrently.
+    """
+
+    def __init__(self):
+        self._lanes: dict = {}
+        self.operations = 0
+        self.waited = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.depth_max = 0
+
+    @contextlib.asynccontextmanager
+    async def lane(self, page):
+        lane = self._lanes.get(page)
+        if lane is None:
+            lane = self._lanes[page] = {"lock": asyncio.Lock(), "depth": 0}
+        lane["depth"] += 1
+        queued = lane["depth"] > 1
+        self.depth_max = max(self.depth_max, lane["depth"])
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            # asyncio.Lock wakes waiters in the order they arrived
+            async with lane["lock"]:
+                wait_ms = (loop.time() - started) * 1000
+                self.operations += 1
+                if queued:
+                    self.waited += 1
+                self.wait_ms_total += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+                yield wait_ms
+        finally:
+            lane["depth"] -= 1
+            if lane["depth"] == 0:
+                del self._lanes[page]
+
+    def stats(self) -> dict:
+        return {
+            "operations": self.operations,
+            "waited": self.waited,
+            "wait_ms_avg": round(self.wait_ms_total / self.operations, 2) if self.operations else 0.0,
+            "wait_ms_max": round(self.wait_ms_max, 2),
+            "queue_depth_max": self.depth_max,
+            "lanes": [
+                {"url": page.url, "queue_depth": lane["depth"]}
+                for page, lane in self._lanes.items()
+            ],
+        }
+
+page_lanes = PageLanes()
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, cheap to update and directly exportable to Prometheus."""
+
+    BOUNDS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.buckets[bisect.bisect_left(self.BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """Estimated by interpolating inside the bucket that holds the q-th sample."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            if bucket and seen + bucket >= rank:
+                lower = self.BOUNDS_MS[index - 1] if index else 0.0
+                upper = self.BOUNDS_MS[index] if index < len(self.BOUNDS_MS) else self.max_ms
+                return min(lower + (upper - lower) * (rank - seen) / bucket, self.max_ms)
+            seen += bucket
+        return self.max_ms
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum_ms, 2),
+            "max_ms": round(self.max_ms, 2),
+            **{f"p{int(q * 100)}_ms": round(self.percentile(q), 2) for q in (0.5, 0.95, 0.99)},
+        }
+
+def _payload_bytes(result: list) -> int:
+    size = 0
+    for item in result:
+        if isinstance(item, types.TextContent):
+            size += len(item.text.encode("utf-8"))
+        elif isinstance(item, types.ImageContent):
+            size += len(item.data)
+        else:
+            size += len(item.model_dump_json())
+    return size
+
+class ToolMetrics:
+    """
+    Per-tool call and error counters, request and response payload bytes, and latency
+    histograms for the whole call and for each phase inside it. Handlers mark their
+    phases with `with tool_metrics.phase("name"):`, which is attributed to the tool
+    call running in the current task.
+    """
+
+    _current_tool = contextvars.ContextVar("current_tool", default=None)
+
+    def __init__(self):
+        self.tools: dict[str, dict] = {}
+
+    def _tool(self, name: str) -> dict:
+        tool = self.tools.get(name)
+        if tool is None:
+            tool = self.tools[name] = {
+                "calls": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0,
+                "latency": LatencyHistogram(), "phases": {},
+            }
+        return tool
+
+    @contextlib.contextmanager
+    def call(self, name: str, arguments: dict):
+        tool = self._tool(name)
+        tool["calls"] += 1
+        tool["bytes_in"] += len(json.dumps(arguments, default=str))
+        token = self._current_tool.set(name)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            tool["errors"] += 1
+            raise
+        finally:
+            tool["latency"].observe((time.perf_counter() - started) * 1000)
+            self._current_tool.reset(token)
+
+    def record_result(self, name: str, result: list):
+        tool = self._tool(name)
+        tool["bytes_out"] += _payload_bytes(result)
+        if _is_error_result(result):
+            tool["errors"] += 1
+
+    def observe(self, phase: str, ms: float):
+        name = self._current_tool.get()
+        if name is None:
+            return
+        phases = self._tool(name)["phases"]
+        if phase not in phases:
+            phases[phase] = LatencyHistogram()
+        phases[phase].observe(ms)
+
+    @contextlib.contextmanager
+    def phase(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, (time.perf_counter() - started) * 1000)
+
+    def snapshot(self) -> dict:
+        return {
+            name: {
+                "calls": tool["calls"], "errors": tool["errors"],
+                "bytes_in": tool["bytes_in"], "bytes_out": tool["bytes_out"],
+                "latency": tool["latency"].summary(),
+                "phases": {phase: histogram.summary() for phase, histogram in tool["phases"].items()},
+            }
+            for name, tool in self.tools.items()
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of the tool metrics plus lane and session gauges."""
+        lines = []
+
+        def histogram(metric: str, labels: str, data: LatencyHistogram):
+            cumulative = 0
+            for bound, bucket in zip(data.BOUNDS_MS + ("+Inf",), data.buckets):
+                cumulative += bucket
+                le = bound if bound == "+Inf" else bound / 1000
+                lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {data.sum_ms / 1000}")
+            lines.append(f"{metric}_count{{{labels}}} {data.count}")
+
+        lines.append("# TYPE mcp_tool_calls_total counter")
+        lines.extend(f'mcp_tool_calls_total{{tool="{name}"}} {tool["calls"]}' for name, tool in self.tools.items())
+        lines.append("# TYPE mcp_tool_errors_total counter")
+        lines.extend(f'mcp_tool_errors_total{{tool="{name}"}} {tool["errors"]}' for name, tool in self.tools.items())
+        lines.append("# TYPE mcp_tool_request_bytes_total counter")
+        lines.extend(f'mcp_tool_request_bytes_total{{tool="{name}"}} {tool["bytes_in"]}' for name, tool in self.tools.items())
+        lines.append("# TYPE mcp_tool_response_bytes_total counter")
+        lines.extend(f'mcp_tool_response_bytes_total{{tool="{name}"}} {tool["bytes_out"]}' for name, tool in self.tools.items())
+        lines.append("# TYPE mcp_tool_duration_seconds histogram")
+        for name, tool in self.tools.items():
+            histogram("mcp_tool_duration_seconds", f'tool="{name}"', tool["latency"])
+        lines.append("# TYPE mcp_tool_phase_duration_seconds histogram")
+        for name, tool in self.tools.items():
+            for phase, data in tool["phases"].items():
+                histogram("mcp_tool_phase_duration_seconds", f'tool="{name}",phase="{phase}"', data)
+
+        lanes = page_lanes.stats()
+        sessions = session_lifecycle.stats()
+        lines.append("# TYPE mcp_lane_wait_seconds_max gauge")
+        lines.append(f"mcp_lane_wait_seconds_max {lanes['wait_ms_max'] / 1000}")
+        lines.append("# TYPE mcp_lane_queue_depth gauge")
+        lines.append(f"mcp_lane_queue_depth {sum(lane['queue_depth'] for lane in lanes['lanes'])}")
+        lines.append("# TYPE mcp_sessions gauge")
+        lines.append(f"mcp_sessions {sessions['sessions']}")
+        lines.append("# TYPE mcp_sessions_evicted_total counter")
+        lines.append(f"mcp_sessions_evicted_total {sessions['evicted']}")
+        lines.append("# TYPE mcp_sessions_reaped_total counter")
+        lines.append(f"mcp_sessions_reaped_total {sessions['reaped']}")
+        return "\n".join(lines) + "\n"
+
+tool_metrics = ToolMetrics()
+
 tool_handlers = {
     "playwright_navigate": NavigateToolHandler(),
     "playwright_screenshot": ScreenshotToolHandler(),
     "playwright_click": ClickToolHandler(),
     "playwright_fill": FillToolHandler(),
     "playwright_evaluate": EvaluateToolHandler(),
+    "playwright_register_script": RegisterScriptToolHandler(),
+    "playwright_call_script": CallScriptToolHandler(),
     "playwright_click_text": ClickTextToolHandler(),
     "playwright_get_text_content": GetTextContentToolHandler(),
     "playwright_get_html_content": GetHtmlContentToolHandler(),
+    "playwright_snapshot": SnapshotToolHandler(),
     "playwright_new_session":NewSessionToolHandler(),
+    "playwright_close_session": CloseSessionToolHandler(),
+    "playwright_save_storage_state": SaveStorageStateToolHandler(),
+    "playwright_load_storage_state": LoadStorageStateToolHandler(),
     "playwright_list_pages": ListPagesToolHandler(),
+    "playwright_fan_out": FanOutToolHandler(),
     "playwright_switch_to_page": SwitchToPageToolHandler(),
     "playwright_frame": FrameToolHandler(),
+    "playwright_list_frames": ListFramesToolHandler(),
     "playwright_wait_for_timeout": WaitForTimeoutToolHandler(),
+    "playwright_wait_for": WaitForToolHandler(),
+    "playwright_batch": BatchToolHandler(),
+    "playwright_record_start": RecordStartToolHandler(),
+    "playwright_record_stop": RecordStopToolHandler(),
+    "playwright_replay": ReplayToolHandler(),
+    "playwright_trace_start": TraceStartToolHandler(),
+    "playwright_trace_save": TraceSaveToolHandler(),
+    "playwright_trace_stop": TraceStopToolHandler(),
     "playwright_download_file": DownloadFileToolHandler(),
+    "playwright_fetch_url": FetchUrlToolHandler(),
+    "playwright_wait_for_download": WaitForDownloadToolHandler(),
+    "playwright_list_downloads": ListDownloadsToolHandler(),
 }
 
 
@@ -536,26 +2960,170 @@ async def handle_call_tool(
     Handle tool execution requests.
     Tools can modify server state and notify clients of changes.
     """
-    if name in tool_handlers:
-        return await tool_handlers[name].handle(name, arguments)
-    else:
+    # Requests are dispatched concurrently by the MCP server, handlers must only touch the session they resolve
+    if name not in tool_handlers:
         raise ValueError(f"Unknown tool: {name}")
+    handler = tool_handlers[name]
+    arguments = arguments or {}
+    with tool_metrics.call(name, arguments):
+        result = await _call_tool(name, handler, arguments)
+    tool_metrics.record_result(name, result)
+    return result
 
-async def main():
-    # Run the server using stdin/stdout streams
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="playwright-plus-server",
-                server_version="0.1.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
-                ),
-            ),
-        )
+async def _call_tool(name: str, handler: ToolHandler, arguments: dict) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+    if name in SESSIONLESS_TOOLS:
+        # Not tied to any page, so never queued behind or counted against an existing session
+        return await handler.handle(name, arguments)
+    connection = current_connection.get()
+    if connection is not None and not arguments.get("session_id"):
+        bound = connection.session()
+        lost = connection.lost_session() if bound is None else None
+        if lost is not None:
+            # Quietly starting over on a blank page would leave the client acting on a page it no longer has
+            return [types.TextContent(type="text", text=f"Error: session {lost[0]} was closed ({lost[1]}), call playwright_new_session to start a new one")]
+        if bound is None:
+            # First call on this connection, give it a session of its own
+            async with connection.lock:
+                bound = connection.session()
+                if bound is None:
+                    with tool_metrics.phase("create_session"):
+                        bound = await NewSessionToolHandler().create({})
+        arguments = {**arguments, "session_id": bound}
+    session_id = handler._session_id(arguments)
+    session = ToolHandler._sessions.get(session_id)
+    recorded_arguments = arguments
+    if session is not None and session.get("recording") is not None and arguments.get("ref"):
+        # Refs only live in this page, record a CSS path to the element instead
+        target = handler._target(session_id, arguments)
+        selector = await target.evaluate(CSS_PATH_JS, arguments["ref"])
+        recorded_arguments = {k: v for k, v in arguments.items() if k != "ref"}
+        recorded_arguments["selector"] = selector
+    started = asyncio.get_running_loop().time()
+    if session is None:
+        result = await handler.handle(name, arguments)
+    else:
+        # Calls are queued on the page the session is on when they arrive
+        with session_lifecycle.in_use(session):
+            async with page_lanes.lane(session["page"]) as wait_ms:
+                tool_metrics.observe("queue", wait_ms)
+                # Only once earlier calls on the page are done, so none of them sees the page change
+                await _adopt_late_popup(session)
+                result = await handler.handle(name, arguments)
+    if session is not None:
+        _record_step(session, name, recorded_arguments, result, (asyncio.get_running_loop().time() - started) * 1000)
+    return result
+
+def initialization_options() -> InitializationOptions:
+    return InitializationOptions(
+        server_name="playwright-plus-server",
+        server_version="0.1.0",
+        capabilities=server.get_capabilities(
+            notification_options=NotificationOptions(),
+            experimental_capabilities={},
+        ),
+    )
+
+class StreamableHTTPApp:
+    """ASGI endpoint handing requests to the streamable HTTP session manager."""
+
+    def __init__(self, session_manager):
+        self.session_manager = session_manager
+
+    async def __call__(self, scope, receive, send):
+        await self.session_manager.handle_request(scope, receive, send)
+
+class ConnectionServer:
+    """Stands in for the server in the streamable HTTP manager so each MCP session runs as its own Connection."""
+
+    def create_initialization_options(self) -> InitializationOptions:
+        return initialization_options()
+
+    async def run(self, read_stream, write_stream, init_options, **kwargs):
+        await _run_connection(read_stream, write_stream, init_options, **kwargs)
+
+def create_http_app(transport: str):
+    """
+    Starlette app for the network transports. sse serves GET /sse with POST /messages/,
+    streamable-http serves /mcp, both serve Prometheus metrics on GET /metrics.
+    Every client connection gets its own browser sessions and resources, closed when it disconnects.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse, Response
+    from starlette.routing import Mount, Route
+
+    async def handle_metrics(request):
+        return PlainTextResponse(tool_metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+    if transport == "sse":
+        from mcp.server.sse import SseServerTransport
+
+        sse = SseServerTransport("/messages/")
+
+        async def handle_sse(request):
+            async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+                await _run_connection(read_stream, write_stream, initialization_options())
+            return Response()
+
+        return Starlette(routes=[
+            Route("/sse", endpoint=handle_sse, methods=["GET"]),
+            Route("/metrics", endpoint=handle_metrics),
+            Mount("/messages/", app=sse.handle_post_message),
+        ])
+
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+
+    session_manager = StreamableHTTPSessionManager(app=ConnectionServer())
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        async with session_manager.run():
+            yield
+
+    return Starlette(routes=[
+        Route("/mcp", endpoint=StreamableHTTPApp(session_manager)),
+        Route("/metrics", endpoint=handle_metrics),
+    ], lifespan=lifespan)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Playwright MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"],
+                        default=os.environ.get("MCP_TRANSPORT", "stdio"))
+    parser.add_argument("--host", default=os.environ.get("MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MCP_PORT", "8931")))
+    parser.add_argument("--max-connections", type=int, default=int(os.environ.get("MCP_MAX_CONNECTIONS", "100")),
+                        help="Concurrent connections before new ones are answered with 503")
+    parser.add_argument("--keep-alive", type=int, default=int(os.environ.get("MCP_KEEP_ALIVE", "30")),
+                        help="Seconds an idle HTTP keep-alive connection stays open")
+    return parser.parse_args(argv)
+
+async def main(argv=None):
+    args = parse_args(argv)
+    # SIGTERM unwinds main like Ctrl-C does, so the finally below still closes every browser
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    # Warm the browser pool in the background so the first tool call does not pay for a cold launch
+    await browser_pool.start()
+    session_lifecycle.start()
+    try:
+        if args.transport == "stdio":
+            # Run the server using stdin/stdout streams
+            async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+                await server.run(read_stream, write_stream, initialization_options())
+        else:
+            import uvicorn
+
+            config = uvicorn.Config(
+                create_http_app(args.transport),
+                host=args.host,
+                port=args.port,
+                limit_concurrency=args.max_connections,
+                timeout_keep_alive=args.keep_alive,
+                log_level="warning",
+            )
+            await uvicorn.Server(config).serve()
+    finally:
+        await session_lifecycle.close()
+        await browser_pool.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -27,7 +27,8 @@ async def test_iframe_interaction():
             
             # Take a screenshot of the initial page
             result = await session.call_tool("playwright_screenshot", arguments={
-                "name": "initial_page"
+                "name": "initial_page",
+                "path": "initial_page.png"
             })
             print("Initial screenshot taken")
             
@@ -38,14 +39,16 @@ async def test_iframe_interaction():
             print(f"Switched to iframe: {result}")
             
             # Wait for the iframe content to fully load
-            result = await session.call_tool("playwright_wait_for_timeout", arguments={
-                "timeout": 1000  # Wait 1 second
+            result = await session.call_tool("playwright_wait_for", arguments={
+                "condition": "selector_visible",
+                "selector": "#nameInput"
             })
             print(f"Waited for iframe to load: {result}")
             
             # Take a screenshot inside the iframe
             result = await session.call_tool("playwright_screenshot", arguments={
-                "name": "inside_iframe"
+                "name": "inside_iframe",
+                "path": "inside_iframe.png"
             })
             print("Screenshot taken inside iframe")
             
@@ -63,14 +66,16 @@ async def test_iframe_interaction():
             print(f"Fill text input with 'Diya': {result}")
             
             # Wait a moment for the change to register
-            result = await session.call_tool("playwright_wait_for_timeout", arguments={
-                "timeout": 1000  # Wait 1 second
+            result = await session.call_tool("playwright_wait_for", arguments={
+                "condition": "dom_quiet",
+                "quiet_ms": 200
             })
             print(f"Waited after input: {result}")
             
             # Take a final screenshot to verify the change
             result = await session.call_tool("playwright_screenshot", arguments={
-                "name": "after_name_change"
+                "name": "after_name_change",
+                "path": "after_name_change.png"
             })
             print("Final screenshot taken")
 
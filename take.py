@@ -1,4 +1,5 @@
 import asyncio
+import json
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 
@@ -74,35 +75,23 @@ async def test_sharepoint_login():
             result = await session.call_tool("playwright_list_pages", arguments={})
             print(f"Available pages: {result}")
             
-            # Try to switch to each available page and check if it's the PowerPoint editor
-            # First get the number of pages
-            pages_info = str(result)
-            page_count = pages_info.count("Page ")
-            print(f"Detected {page_count} pages")
+            # Read every tab's title in one round trip and switch to the PowerPoint editor
+            result = await session.call_tool("playwright_fan_out", arguments={
+                "operation": "evaluate",
+                "script": "document.title"
+            })
+            titles = json.loads(result.content[0].text)
+            page_count = len(titles)
+            print(f"Detected {page_count} pages: {titles}")
             
             powerpoint_page_found = False
-            for i in range(page_count):
-                # Switch to this page
-                result = await session.call_tool("playwright_switch_to_page", arguments={
-                    "index": i
-                })
-                print(f"Switched to page {i}: {result}")
-                
-                # Check if this is the PowerPoint page
-                result = await session.call_tool("playwright_evaluate", arguments={
-                    "script": "document.title"
-                })
-                page_title = str(result)
-                print(f"Page {i} title: {page_title}")
-                
-                # Take a screenshot of this page
-                result = await session.call_tool("playwright_screenshot", arguments={
-                    "name": f"page_{i}"
-                })
-                print(f"Screenshot taken of page {i}")
-                
+            for index, entry in titles.items():
+                page_title = str(entry.get("result", ""))
                 if "PowerPoint" in page_title or "presentation" in page_title.lower():
-                    print(f"Found PowerPoint editor on page {i}")
+                    result = await session.call_tool("playwright_switch_to_page", arguments={
+                        "index": int(index)
+                    })
+                    print(f"Found PowerPoint editor on page {index}: {result}")
                     powerpoint_page_found = True
                     break
             